@@ -0,0 +1,255 @@
+"""
+Сквозной нагрузочный тест бота.
+
+Поднимается локальная заглушка Bot API (benchmarks.fake_bot_api), отдельная база MongoDB
+наполняется синтетическими данными (benchmarks.fixtures), и настоящий dp со всеми
+middleware и обработчиками получает апдейты с заданной частотой (benchmarks.updates).
+Для каждого сценария печатаются пропускная способность, p50/p99 задержки обработки
+апдейта, число запросов к Bot API и операций MongoDB на апдейт.
+
+Сценарии: восстановление после перезапуска (загрузка индекса комнат и удаление планировщиком
+комнат, истекших за простой), /list с листанием, /find, диалог /add и /broadcast по всем чатам.
+
+Нужен запущенный MongoDB; база из --db удаляется и заполняется заново.
+Запуск из корня репозитория:
+    python -m benchmarks.bench_load --mongo mongodb://127.0.0.1:27017/ --rooms 10000 --chats 100000
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+from benchmarks.fake_bot_api import FakeBotAPI
+
+BOT_TOKEN = "123456:load-test-token"
+# Администратор вне диапазона пользователей из набора данных
+ADMIN_ID = 1_000_000_000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота на заглушке Bot API")
+    parser.add_argument('--mongo', default="mongodb://127.0.0.1:27017/", help="адрес MongoDB")
+    parser.add_argument('--db', default="ggd_loadtest", help="отдельная база для теста, удаляется перед наполнением")
+    parser.add_argument('--users', type=int, default=20_000)
+    parser.add_argument('--chats', type=int, default=100_000)
+    parser.add_argument('--rooms', type=int, default=10_000)
+    parser.add_argument('--expired-share', type=float, default=0.1, help="доля комнат, истекших за время простоя")
+    parser.add_argument('--scenarios', default="list,find,add,broadcast", help="сценарии через запятую")
+    parser.add_argument('--sessions', type=int, default=1_000, help="сценариев (пользователей) на каждый тип")
+    parser.add_argument('--rate', type=float, default=200, help="запусков сценариев в секунду")
+    parser.add_argument('--broadcast-timeout', type=float, default=30, help="сколько секунд наблюдать за рассылкой")
+    parser.add_argument('--retry-rate', type=float, default=0.0, help="доля ответов 429 от Bot API")
+    parser.add_argument('--retry-after', type=int, default=1, help="retry_after в ответах 429, в секундах")
+    parser.add_argument('--blocked-rate', type=float, default=0.0, help="доля sendMessage в группы с ответом 403")
+    parser.add_argument('--api-latency', type=float, default=0.0, help="задержка ответа Bot API, в секундах")
+    parser.add_argument('--fsm-storage', default="mongo", choices=("mongo", "memory"))
+    parser.add_argument('--keep', action='store_true', help="не удалять базу после теста")
+    parser.add_argument('--verbose', action='store_true', help="не заглушать логи бота ниже WARNING")
+
+    return parser.parse_args()
+
+
+# Бот читает настройки из .env в текущей папке, поэтому тест запускается из временной папки со своим .env
+def write_env(directory: str, api_url: str, args) -> None:
+    settings = {
+        'API_TOKEN': BOT_TOKEN,
+        'ADMIN_ID': ADMIN_ID,
+        'MONGO_CLIENT': args.mongo,
+        'MONGO_DB': args.db,
+        'TELEGRAM_API_URL': api_url,
+        'FSM_STORAGE': args.fsm_storage,
+        'UPDATES_MODE': "polling",
+        'METRICS_PORT': 0,
+        'LOG_FILE': os.path.join(directory, 'bot.log')
+    }
+
+    with open(os.path.join(directory, '.env'), 'w') as f:
+        f.writelines(f"{key}={value}\n" for key, value in settings.items())
+
+
+def percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def mongo_operations() -> int:
+    from src.metrics import mongo_latency
+    return sum(series[-1] for series in mongo_latency.values.values())
+
+
+class Measurement:
+    """Счетчики Bot API и MongoDB до и после сценария"""
+
+    def __init__(self, name: str, api: FakeBotAPI):
+        self.name = name
+        self.api = api
+        self.latencies = []
+        self.errors = 0
+
+    def __enter__(self):
+        self.api_calls = self.api.total_calls
+        self.mongo_ops = mongo_operations()
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self.started_at
+        self.api_calls = self.api.total_calls - self.api_calls
+        self.mongo_ops = mongo_operations() - self.mongo_ops
+
+    def report(self, updates: int = None):
+        updates = len(self.latencies) if updates is None else updates
+        per_update = max(updates, 1)
+
+        print(
+            f"{self.name:<10} апдейтов {updates:>6}, {updates / self.elapsed:>7.1f}/с, "
+            f"p50 {percentile(self.latencies, 0.5) * 1000:>7.2f} мс, "
+            f"p99 {percentile(self.latencies, 0.99) * 1000:>7.2f} мс, "
+            f"Bot API/апдейт {self.api_calls / per_update:>5.2f}, "
+            f"Mongo/апдейт {self.mongo_ops / per_update:>6.2f}, ошибок {self.errors}"
+        )
+
+
+# Истекшие за простой комнаты планировщик удаляет в фоне: ждем, пока в базе не останется просроченных
+async def wait_overdue_deleted(rooms_collection, timeout: float):
+    from src.clock import utc_now
+
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline and await rooms_collection.count_documents({'expires_at': {'$lte': utc_now()}}):
+        await asyncio.sleep(0.05)
+
+
+async def drive(dp, bot, factory, scenario, user_ids, rate: float, measurement: Measurement):
+    """Сценарии стартуют с частотой rate, шаги внутри сценария идут последовательно"""
+
+    async def run_session(user_id: int):
+        for update in scenario(factory, user_id):
+            started_at = time.perf_counter()
+            try:
+                await dp.feed_raw_update(bot, update)
+            except Exception:
+                measurement.errors += 1
+            measurement.latencies.append(time.perf_counter() - started_at)
+
+    started_at = time.perf_counter()
+    sessions = []
+    for index, user_id in enumerate(user_ids):
+        delay = started_at + index / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        sessions.append(asyncio.create_task(run_session(user_id)))
+
+    await asyncio.gather(*sessions)
+
+
+async def run_broadcast(dp, bot, factory, api: FakeBotAPI, total_chats: int, timeout: float):
+    from src.broadcast import broadcast_tasks
+    from benchmarks.updates import broadcast_scenario
+
+    with Measurement('broadcast', api) as measurement:
+        sent_before, retried_before, blocked_before = api.calls['sendmessage'], api.retried, api.blocked
+        for update in broadcast_scenario(factory, ADMIN_ID):
+            await dp.feed_raw_update(bot, update)
+
+        # Рассылка идет фоновой задачей: наблюдаем до окончания или до таймаута
+        tasks = list(broadcast_tasks)
+        done, pending = await asyncio.wait(tasks, timeout=timeout) if tasks else (set(), set())
+        for task in pending:
+            task.cancel()
+
+    sent = api.calls['sendmessage'] - sent_before
+    rate = sent / measurement.elapsed
+    finished = "завершена" if not pending else f"остановлена через {timeout:.0f} с"
+
+    print(
+        f"{'broadcast':<10} рассылка {finished}: sendMessage {sent} за {measurement.elapsed:.1f} с "
+        f"({rate:.1f}/с), 429: {api.retried - retried_before}, 403: {api.blocked - blocked_before}, "
+        f"Mongo операций {measurement.mongo_ops}"
+    )
+    if pending and rate:
+        print(f"{'':<10} все {total_chats} чатов заняли бы примерно {total_chats / rate / 60:.1f} мин")
+
+
+async def run(args, api: FakeBotAPI):
+    # Импорт после записи .env: конфигурация бота читается при импорте
+    from src.config import bot, dp, db, rooms_collection
+    from src.acl import admin_acl
+    from src.database import ensure_indexes
+    from src.room_index import room_index
+    from src.tasks import restore_auto_deletion_tasks
+    import src.controller  # noqa: F401 регистрация обработчиков
+    from benchmarks.fixtures import Fixture
+    from benchmarks.updates import UpdateFactory, SCENARIOS
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+        # Исключения обработчиков (например, внедренные 429) считаются в отчете, трейсы не нужны
+        logging.getLogger('aiogram.event').setLevel(logging.CRITICAL)
+
+    fixture = Fixture(users=args.users, chats=args.chats, rooms=args.rooms, expired_share=args.expired_share)
+    started_at = time.perf_counter()
+    counts = await fixture.seed(db)
+    await ensure_indexes()
+    await admin_acl.load()
+    print(f"Наполнение базы {args.db}: {counts} за {time.perf_counter() - started_at:.1f} с\n")
+
+    # Восстановление после перезапуска: загрузка индекса комнат и удаление истекших комнат планировщиком
+    with Measurement('restore', api) as measurement:
+        await restore_auto_deletion_tasks(bot, rooms_collection)
+        await room_index.load()
+        await wait_overdue_deleted(rooms_collection, args.broadcast_timeout)
+    print(f"{'restore':<10} {measurement.elapsed * 1000:.0f} мс, комнат в индексе {len(room_index)}, "
+          f"Bot API вызовов {measurement.api_calls}, Mongo операций {measurement.mongo_ops}")
+
+    factory = UpdateFactory()
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    for name in scenarios:
+        if name == 'broadcast':
+            continue
+        if name not in SCENARIOS:
+            raise SystemExit(f"Неизвестный сценарий: {name}")
+
+        # Диалог /add ведут пользователи без комнат, просмотр - все подряд
+        first_user = fixture.first_free_user if name == 'add' else 1
+        user_ids = range(first_user, first_user + args.sessions)
+
+        with Measurement(name, api) as measurement:
+            await drive(dp, bot, factory, SCENARIOS[name], user_ids, args.rate, measurement)
+        measurement.report()
+
+    if 'broadcast' in scenarios:
+        await run_broadcast(dp, bot, factory, api, fixture.chats, args.broadcast_timeout)
+
+    if not args.keep:
+        await db.client.drop_database(args.db)
+    await bot.session.close()
+
+
+async def main():
+    args = parse_args()
+    if args.db == "ggd":
+        raise SystemExit("Нагрузочный тест удаляет базу: укажите отдельную базу через --db")
+
+    api = FakeBotAPI(retry_rate=args.retry_rate, retry_after=args.retry_after, blocked_rate=args.blocked_rate,
+                     latency=args.api_latency)
+    api_url = await api.start()
+
+    directory = tempfile.mkdtemp(prefix="bench_load_")
+    write_env(directory, api_url, args)
+    os.chdir(directory)
+
+    try:
+        await run(args, api)
+    finally:
+        await api.stop()
+
+    print("\nВызовы Bot API по методам:", dict(api.calls))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
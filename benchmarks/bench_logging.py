@@ -0,0 +1,104 @@
+"""
+Задержки цикла событий при интенсивном логировании.
+
+Имитируется восстановление 10 000 комнат со строкой лога на каждую (как делал прежний
+restore_auto_deletion_tasks). Параллельно работает корутина-пульс, которая засыпает на 1 мс
+и замеряет, насколько позже она просыпается. Сравниваются прежняя схема (StreamHandler и
+FileHandler прямо в цикле событий), очередь с фоновым потоком и очередь с сэмплированием.
+
+Запуск из корня репозитория: python -m benchmarks.bench_logging
+"""
+import asyncio
+import logging
+import logging.handlers
+import os
+import queue
+import statistics
+import tempfile
+import time
+
+from src.log import JSONFormatter, SamplingFilter, TEXT_FORMAT
+
+ROOMS = 10_000
+# Комнат между ожиданиями базы: восстановление отдает управление циклу после каждой пачки
+BATCH = 100
+TICK = 0.001
+
+
+def create_handlers(directory: str):
+    console_handler = logging.StreamHandler(open(os.devnull, 'w'))
+    console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    file_handler = logging.FileHandler(os.path.join(directory, 'bot.log'), encoding='utf-8')
+    file_handler.setFormatter(JSONFormatter())
+
+    return [console_handler, file_handler]
+
+
+def direct_logger(name: str, directory: str):
+    logger = logging.getLogger(name)
+    logger.handlers = create_handlers(directory)
+    return logger, None
+
+
+def queued_logger(name: str, directory: str, sampling: bool = False):
+    listener = logging.handlers.QueueListener(queue.SimpleQueue(), *create_handlers(directory))
+    queue_handler = logging.handlers.QueueHandler(listener.queue)
+    if sampling:
+        queue_handler.addFilter(SamplingFilter(rate=5, burst=20))
+
+    logger = logging.getLogger(name)
+    logger.handlers = [queue_handler]
+    listener.start()
+
+    return logger, listener
+
+
+async def restore(logger: logging.Logger):
+    for room_id in range(ROOMS):
+        logger.info(f"Восстановлена задача авто-удаления комнаты {room_id}", extra={'room_id': room_id})
+        if room_id % BATCH == 0:
+            await asyncio.sleep(0)
+
+
+async def heartbeat(lags: list, stop: asyncio.Event):
+    while not stop.is_set():
+        started_at = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - started_at - TICK)
+
+
+async def measure(name: str, logger: logging.Logger, listener):
+    lags = []
+    stop = asyncio.Event()
+    pulse = asyncio.create_task(heartbeat(lags, stop))
+    await asyncio.sleep(TICK)
+
+    started_at = time.perf_counter()
+    await restore(logger)
+    elapsed = time.perf_counter() - started_at
+
+    stop.set()
+    await pulse
+    if listener is not None:
+        listener.stop()
+
+    lags.sort()
+    print(f"{name:<30} восстановление {elapsed * 1000:>7.1f} мс, "
+          f"задержка цикла: p50 {statistics.median(lags) * 1000:>5.2f} мс, "
+          f"p99 {lags[int(len(lags) * 0.99)] * 1000:>6.2f} мс, макс {lags[-1] * 1000:>6.2f} мс")
+
+
+async def main():
+    logging.getLogger().setLevel(logging.INFO)
+    print(f"Комнат: {ROOMS}, строк лога: {ROOMS}\n")
+
+    with tempfile.TemporaryDirectory() as directory:
+        await measure("FileHandler в цикле событий", *direct_logger('bench.direct', directory))
+    with tempfile.TemporaryDirectory() as directory:
+        await measure("QueueHandler + поток", *queued_logger('bench.queued', directory))
+    with tempfile.TemporaryDirectory() as directory:
+        await measure("QueueHandler + сэмплирование", *queued_logger('bench.sampled', directory, sampling=True))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
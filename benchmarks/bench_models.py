@@ -0,0 +1,93 @@
+"""
+Стоимость разбора документа комнаты и занимаемая память.
+
+Документы комнат в нынешнем виде, после переноса оценок и подписок в отдельные коллекции:
+во владельце только счетчики. Каждый вариант разбирает BSON, как это делает драйвер, и собирает
+модель: полный Room с владельцем и чатом или RoomSummary из проекции под карточку.
+Память считается по тому, что остается жить вместе с моделями.
+
+Запуск из корня репозитория: python -m benchmarks.bench_models
+"""
+import timeit
+import tracemalloc
+
+import bson
+from bson import ObjectId
+
+from src.clock import utc_now
+from src.models import Room, RoomSummary, ROOM_SUMMARY_PROJECTION
+
+ROOMS = 10_000
+REPEAT = 5
+
+
+def make_room_document(index: int) -> dict:
+    owner = {'user_id': index, 'is_admin': False, 'likes': 120, 'dislikes': 30, 'subscriber_count': 45}
+
+    return {
+        '_id': ObjectId(),
+        'code': f"ROOM{index:03d}",
+        'host': f"host{index}",
+        'map': "Черный Лебедь",
+        'game_mode': "Classic",
+        'owner': owner,
+        'owner_id': index,
+        'chat': {'chat_id': index},
+        'chat_id': index,
+        'created_at': utc_now(),
+        'expires_at': utc_now(),
+        'version': 0
+    }
+
+
+# Проекция, как ее применяет MongoDB: только перечисленные поля, вложенные через точку
+def project(document: dict, projection: dict) -> dict:
+    projected = {'_id': document['_id']}
+
+    for field in projection:
+        head, _, tail = field.partition('.')
+        if head not in document:
+            continue
+        if tail:
+            projected.setdefault(head, {})[tail] = document[head][tail]
+        else:
+            projected[head] = document[head]
+
+    return projected
+
+
+def decode_room(raw_documents):
+    return [Room.from_dict(bson.decode(raw)) for raw in raw_documents]
+
+
+def decode_summary(raw_documents):
+    return [RoomSummary.from_dict(bson.decode(raw)) for raw in raw_documents]
+
+
+def measure(name, decode, raw_documents):
+    seconds = min(timeit.repeat(lambda: decode(raw_documents), number=1, repeat=REPEAT))
+
+    tracemalloc.start()
+    models = decode(raw_documents)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del models
+
+    print(f"{name:<28} {seconds / len(raw_documents) * 1e6:>8.2f} мкс/комната "
+          f"{retained / len(raw_documents):>8.0f} байт/комната "
+          f"{len(raw_documents[0]):>6} байт BSON")
+
+
+def main():
+    document = make_room_document(0)
+    # Одни и те же байты разбираются заново для каждой комнаты
+    raw_full = [bson.encode(document)] * ROOMS
+    raw_summary = [bson.encode(project(document, ROOM_SUMMARY_PROJECTION))] * ROOMS
+
+    print(f"Комнат: {ROOMS}\n")
+    measure("Room + owner + chat", decode_room, raw_full)
+    measure("RoomSummary из проекции", decode_summary, raw_summary)
+
+
+if __name__ == '__main__':
+    main()
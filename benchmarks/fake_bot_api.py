@@ -0,0 +1,105 @@
+"""
+Локальная заглушка Bot API для нагрузочных тестов.
+
+Отвечает на методы, которыми пользуется бот, правдоподобными объектами, считает вызовы
+по методам и по заданным долям отвечает 429 (RetryAfter) или 403 (бот удален из группы).
+Бот подключается к ней через TELEGRAM_API_URL.
+"""
+import asyncio
+import itertools
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+# Методы, которые возвращают отправленное или измененное сообщение
+MESSAGE_METHODS = {'sendmessage', 'editmessagetext', 'editmessagereplymarkup'}
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': "Load test", 'username': "load_test_bot"}
+
+
+class FakeBotAPI:
+    def __init__(self, retry_rate: float = 0.0, retry_after: int = 1, blocked_rate: float = 0.0,
+                 latency: float = 0.0, seed: int = 0):
+        self.retry_rate = retry_rate
+        self.retry_after = retry_after
+        self.blocked_rate = blocked_rate
+        self.latency = latency
+        self.calls = Counter()  # метод -> количество вызовов
+        self.retried = 0
+        self.blocked = 0
+        self._message_ids = itertools.count(1)
+        self._random = random.Random(seed)
+        self._runner = None
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def snapshot(self) -> Counter:
+        return Counter(self.calls)
+
+    @staticmethod
+    def make_message(message_id: int, chat_id, text: str) -> dict:
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+            'text': text or ""
+        }
+
+    def make_result(self, method: str, form) -> dict:
+        if method == 'getme':
+            return BOT_USER
+        if method in MESSAGE_METHODS:
+            chat_id = form.get('chat_id', 0)
+            chat_id = int(chat_id) if str(chat_id).lstrip('-').isdigit() else 0
+            message_id = int(form['message_id']) if 'message_id' in form else next(self._message_ids)
+            return self.make_message(message_id, chat_id, form.get('text'))
+
+        return True
+
+    async def handle(self, request: web.Request):
+        method = request.match_info['method'].lower()
+        form = await request.post()
+        self.calls[method] += 1
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        # Из групп (отрицательные id) бот мог быть удален: в них пишет только рассылка
+        if method == 'sendmessage' and form.get('chat_id', '').startswith('-') \
+                and self._random.random() < self.blocked_rate:
+            self.blocked += 1
+            return web.json_response({
+                'ok': False, 'error_code': 403, 'description': "Forbidden: bot was kicked from the group chat"
+            }, status=403)
+
+        if self._random.random() < self.retry_rate:
+            self.retried += 1
+            return web.json_response({
+                'ok': False,
+                'error_code': 429,
+                'description': f"Too Many Requests: retry after {self.retry_after}",
+                'parameters': {'retry_after': self.retry_after}
+            }, status=429)
+
+        return web.json_response({'ok': True, 'result': self.make_result(method, form)})
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+        # При port=0 порт выбирает система
+        host, port = self._runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
@@ -0,0 +1,118 @@
+"""
+Синтетические данные для нагрузочных тестов: пользователи, чаты, комнаты, оценки и подписки.
+
+Документы собираются теми же моделями, что и в боте, и пишутся пачками прямо в коллекции
+базы (без оберток с метриками), чтобы наполнение не попадало в замеры.
+"""
+import random
+from datetime import timedelta
+
+from src.clock import utc_now
+from src.models import Room, User, Chat, Rating, Subscription, Map, GameMode
+
+SEED_BATCH_SIZE = 5_000
+COLLECTIONS = ('users', 'chats', 'rooms', 'ratings', 'subscriptions', 'fsm', 'leases')
+
+
+class Fixture:
+    """Размеры набора данных; владельцы комнат - первые rooms пользователей"""
+
+    def __init__(self, users: int = 20_000, chats: int = 100_000, rooms: int = 10_000,
+                 ratings_per_room: int = 5, subscribers_per_room: int = 3, expired_share: float = 0.1,
+                 seed: int = 0):
+        self.users = max(users, rooms)
+        self.chats = max(chats, self.users)
+        self.rooms = rooms
+        self.ratings_per_room = ratings_per_room
+        self.subscribers_per_room = subscribers_per_room
+        self.expired_share = expired_share
+        self.random = random.Random(seed)
+
+    # Пользователи без комнат: с них начинаются диалоги /add
+    @property
+    def first_free_user(self) -> int:
+        return self.rooms + 1
+
+    # Счетчики владельца одинаковы в документе пользователя и во владельце, встроенном в комнату
+    def make_user(self, user_id: int) -> User:
+        if user_id > self.rooms:
+            return User(user_id=user_id)
+
+        likes = user_id * 7 % (self.ratings_per_room + 1)
+        return User(user_id=user_id, likes=likes, dislikes=self.ratings_per_room - likes,
+                    subscriber_count=self.subscribers_per_room)
+
+    def user_documents(self):
+        for user_id in range(1, self.users + 1):
+            yield self.make_user(user_id).to_dict()
+
+    def chat_documents(self):
+        # Личные чаты пользователей совпадают с их id, остальные - группы с отрицательными id
+        for chat_id in range(1, self.users + 1):
+            yield Chat(chat_id=chat_id).to_dict()
+        for index in range(self.chats - self.users):
+            yield Chat(chat_id=-(index + 1)).to_dict()
+
+    def room_documents(self):
+        now = utc_now()
+        maps, game_modes = list(Map), list(GameMode)
+
+        for index in range(self.rooms):
+            owner_id = index + 1
+            expired = self.random.random() < self.expired_share
+            expires_at = now - timedelta(minutes=1) if expired else now + timedelta(minutes=self.random.randint(1, 30))
+
+            room = Room(
+                code=f"R{index:06d}",
+                host=f"host{owner_id}",
+                map=self.random.choice(maps),
+                game_mode=self.random.choice(game_modes),
+                owner=self.make_user(owner_id),
+                chat=Chat(chat_id=owner_id),
+                created_at=now - timedelta(minutes=self.random.randint(0, 60)),
+                expires_at=expires_at
+            )
+            yield room.to_dict()
+
+    def rating_documents(self):
+        for owner_id in range(1, self.rooms + 1):
+            for user_id in self.random.sample(range(1, self.users + 1), self.ratings_per_room):
+                yield Rating(owner_id=owner_id, user_id=user_id, rating=self.random.random() < 0.7).to_dict()
+
+    def subscription_documents(self):
+        for owner_id in range(1, self.rooms + 1):
+            for chat_id in self.random.sample(range(1, self.users + 1), self.subscribers_per_room):
+                yield Subscription(owner_id=owner_id, chat_id=chat_id).to_dict()
+
+    async def seed(self, db) -> dict:
+        for name in COLLECTIONS:
+            await db[name].drop()
+
+        counts = {}
+        for name, documents in (
+            ('users', self.user_documents()),
+            ('chats', self.chat_documents()),
+            ('rooms', self.room_documents()),
+            ('ratings', self.rating_documents()),
+            ('subscriptions', self.subscription_documents())
+        ):
+            counts[name] = await insert_batched(db[name], documents)
+
+        return counts
+
+
+async def insert_batched(collection, documents) -> int:
+    batch, inserted = [], 0
+
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= SEED_BATCH_SIZE:
+            await collection.insert_many(batch, ordered=False)
+            inserted += len(batch)
+            batch = []
+
+    if batch:
+        await collection.insert_many(batch, ordered=False)
+        inserted += len(batch)
+
+    return inserted
@@ -0,0 +1,464 @@
+"""
+Симуляция жизненного цикла комнат в виртуальном времени.
+
+Цикл событий работает на VirtualClock: когда готовых задач нет, время перескакивает
+к ближайшему таймеру, поэтому LIFE_TIME и NOTIFY_TIME проходят мгновенно. Поверх него
+настоящий ExpiryScheduler и функции из src.tasks получают поток событий: создание,
+продление (/update), удаление пользователем и перезапуск бота с простоем, после которого
+истекшие за простой комнаты удаляет сам планировщик.
+
+Проверяется, что каждое предупреждение и каждое удаление срабатывает ровно один раз и вовремя
+(с допуском --tolerance): ни одно не потеряно, не повторено и не пришло для уже удаленной
+или продленной комнаты. В конце печатаются процессорное время планировщика и память
+его структур на одну живую комнату.
+
+Запуск из корня репозитория: python -m benchmarks.sim_expiry --events 1000000
+"""
+import argparse
+import asyncio
+import logging
+import random
+import selectors
+import sys
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+from bson import ObjectId
+
+import src.tasks as tasks
+from src.clock import VirtualClock, set_clock, now_timestamp, expires_after, to_timestamp
+from src.models import Map, GameMode
+from src.tasks import ExpiryScheduler, LIFE_TIME, NOTIFY_TIME, EXPIRY_HORIZON
+
+# Веса типов событий пользователей
+EVENT_WEIGHTS = {'create': 40, 'update': 35, 'cancel': 25}
+# Сколько примеров каждой ошибки печатать
+ERROR_EXAMPLES = 3
+# Столько итераций цикла без движения времени означают, что кто-то крутится вхолостую
+STALL_ITERATIONS = 1_000_000
+
+
+class VirtualTimeSelector:
+    """Селектор, который вместо ожидания переводит виртуальные часы на время ожидания"""
+
+    def __init__(self, clock: VirtualClock):
+        self.clock = clock
+        self._selector = selectors.DefaultSelector()
+        self._idle_iterations = 0
+
+    def select(self, timeout=None):
+        events = self._selector.select(0)
+        if events or timeout == 0:
+            self._idle_iterations += 1
+            if self._idle_iterations > STALL_ITERATIONS:
+                raise RuntimeError(f"Время не идет уже {STALL_ITERATIONS} итераций цикла: активное ожидание")
+            return events
+        if timeout is None:
+            raise RuntimeError("Симуляция зависла: нет ни готовых задач, ни таймеров")
+
+        self.clock.advance(timeout)
+        self._idle_iterations = 0
+        return []
+
+    def __getattr__(self, name):
+        return getattr(self._selector, name)
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    def __init__(self, clock: VirtualClock):
+        super().__init__(VirtualTimeSelector(clock))
+        self.clock = clock
+
+    def time(self):
+        return self.clock.monotonic()
+
+
+class SimRooms:
+    """Коллекция комнат в памяти: ровно те запросы, которые делают планировщик и восстановление"""
+
+    def __init__(self):
+        self.documents = {}
+
+    def insert(self, room_id, expires_at):
+        self.documents[room_id] = {
+            '_id': room_id,
+            'code': str(room_id)[-7:].upper(),
+            'host': "host",
+            'map': Map.THE_CARNIVAL.value,
+            'game_mode': GameMode.CLASSIC.value,
+            'owner': {'user_id': 1},
+            'chat': {'chat_id': 1},
+            'expires_at': expires_at
+        }
+
+    @staticmethod
+    def matches(document, query) -> bool:
+        return all(SimRooms.matches_condition(document.get(field), condition) for field, condition in query.items())
+
+    # Как в MongoDB: сравнение с отсутствующим полем ложно, а $not выполняется и для него
+    @staticmethod
+    def matches_condition(value, condition) -> bool:
+        for operator, operand in condition.items():
+            if operator == '$not':
+                if SimRooms.matches_condition(value, operand):
+                    return False
+            elif operator == '$in' and value not in operand \
+                    or operator == '$gt' and (value is None or not value > operand) \
+                    or operator == '$lte' and (value is None or not value <= operand):
+                return False
+
+        return True
+
+    # Запросы по _id идут по словарю, как по индексу, остальные - полным просмотром
+    def select(self, query):
+        if '_id' not in query:
+            return [document for document in self.documents.values() if self.matches(document, query)]
+
+        conditions = {field: condition for field, condition in query.items() if field != '_id'}
+        documents = (self.documents.get(room_id) for room_id in query['_id']['$in'])
+        return [document for document in documents if document is not None and self.matches(document, conditions)]
+
+    async def find(self, query, projection=None):
+        for document in self.select(query):
+            yield document
+
+    async def delete_many(self, query):
+        documents = self.select(query)
+        for document in documents:
+            del self.documents[document['_id']]
+
+        return SimpleNamespace(deleted_count=len(documents))
+
+
+class Epoch:
+    """Один дедлайн комнаты: от планирования до удаления, продления или отмены"""
+
+    __slots__ = ('deadline', 'warn_expected', 'warned')
+
+    def __init__(self, deadline: float, scheduled_at: float):
+        self.deadline = deadline
+        self.warn_expected = deadline - scheduled_at > NOTIFY_TIME
+        self.warned = False
+
+
+class Tracker:
+    """Ожидаемое состояние комнат и проверка каждого срабатывания планировщика"""
+
+    def __init__(self, tolerance: float):
+        self.tolerance = tolerance
+        self.epochs = {}  # room_id -> Epoch
+        self.finished = set()
+        self.errors = Counter()
+        self.examples = {}
+        self.warnings = 0
+        self.deletions = 0
+        self.restore_deletions = 0
+        self.stopped_at = None
+
+    def error(self, kind: str, room_id, detail: str = ""):
+        self.errors[kind] += 1
+        self.examples.setdefault(kind, [])
+        if len(self.examples[kind]) < ERROR_EXAMPLES:
+            self.examples[kind].append(f"{room_id} {detail}".strip())
+
+    def open(self, room_id, deadline: float):
+        self.epochs[room_id] = Epoch(deadline, now_timestamp())
+
+    # Проверки при закрытии дедлайна: к моменту at все, что должно было сработать, сработало
+    def close(self, room_id, at: float, deleted: bool = False):
+        self.check(room_id, self.epochs.pop(room_id), at, deleted)
+
+    def check(self, room_id, epoch: Epoch, at: float, deleted: bool = False):
+        if epoch.warn_expected and not epoch.warned and epoch.deadline - NOTIFY_TIME + self.tolerance < at:
+            self.error('missed_warning', room_id, f"дедлайн {epoch.deadline:.0f}")
+        if not deleted and epoch.deadline + self.tolerance < at:
+            self.error('missed_deletion', room_id, f"дедлайн {epoch.deadline:.0f}, сейчас {at:.0f}")
+
+    def reschedule(self, room_id, deadline: float):
+        self.close(room_id, now_timestamp())
+        self.open(room_id, deadline)
+
+    def cancel(self, room_id):
+        self.close(room_id, now_timestamp())
+        self.finished.add(room_id)
+
+    def on_warning(self, room_id):
+        now = now_timestamp()
+        epoch = self.epochs.get(room_id)
+        self.warnings += 1
+
+        if epoch is None:
+            self.error('warning_for_finished_room', room_id)
+        elif epoch.warned:
+            self.error('duplicate_warning', room_id)
+        elif not epoch.warn_expected:
+            self.error('unexpected_warning', room_id)
+        elif abs(now - (epoch.deadline - NOTIFY_TIME)) > self.tolerance:
+            self.error('warning_off_time', room_id, f"на {now - epoch.deadline + NOTIFY_TIME:+.1f} с")
+        else:
+            epoch.warned = True
+
+    def on_deletion(self, room_id):
+        now = now_timestamp()
+        epoch = self.epochs.get(room_id)
+        self.deletions += 1
+
+        if epoch is None:
+            self.error('duplicate_deletion' if room_id in self.finished else 'deletion_of_unknown_room', room_id)
+            return
+        if abs(now - epoch.deadline) > self.tolerance:
+            self.error('deletion_off_time', room_id, f"на {now - epoch.deadline:+.1f} с")
+
+        self.close(room_id, now, deleted=True)
+        self.finished.add(room_id)
+
+    # Бот остановлен: все, что должно было сработать до остановки, уже сработало
+    def on_stop(self):
+        self.stopped_at = now_timestamp()
+
+    # Восстановление после простоя: комнаты, истекшие за простой, планировщик удаляет сразу после запуска,
+    # а те, что истекли еще до остановки, он должен был удалить до нее
+    def on_restore(self):
+        restored_at = now_timestamp()
+
+        for room_id, epoch in self.epochs.items():
+            if epoch.deadline <= restored_at:
+                self.check(room_id, epoch, self.stopped_at)
+                epoch.deadline = restored_at
+                self.restore_deletions += 1
+
+        # Предупреждения, чье время пришлось на простой, не отправляются
+        for epoch in self.epochs.values():
+            if not epoch.warned and epoch.deadline - restored_at <= NOTIFY_TIME:
+                epoch.warn_expected = False
+
+
+class SimulatedScheduler(ExpiryScheduler):
+    """Настоящий планировщик: срабатывания уходят в Tracker, время его работы суммируется"""
+
+    def __init__(self, tracker: Tracker, rooms: SimRooms, pool, stats):
+        super().__init__(use_lease=False)
+        self.tracker = tracker
+        self.sim_rooms = rooms
+        self.pool = pool
+        # Общие для всех экземпляров: после перезапуска создается новый планировщик
+        self.stats = stats
+
+    def _timed(self, method, *args):
+        started_at = time.process_time()
+        try:
+            return method(*args)
+        finally:
+            self.stats.cpu_time += time.process_time() - started_at
+            self.stats.operations += 1
+
+    def schedule(self, room_id, deadline):
+        return self._timed(super().schedule, room_id, deadline)
+
+    def cancel(self, room_id):
+        return self._timed(super().cancel, room_id)
+
+    def _pop_due(self, now):
+        return self._timed(super()._pop_due, now)
+
+    # Коллекция в памяти не отдает управление циклу, поэтому замер не захватывает чужие задачи
+    async def _load_window(self):
+        started_at = time.process_time()
+        await super()._load_window()
+        self.stats.cpu_time += time.process_time() - started_at
+
+    async def warn(self, rooms):
+        for room in rooms:
+            self.tracker.on_warning(room.room_id)
+
+    # Удаление идет настоящим запросом из src.tasks, в том числе с проверкой продления после выборки
+    async def expire(self, rooms):
+        for room in await tasks.delete_due_rooms(rooms, self.sim_rooms):
+            self.tracker.on_deletion(room.room_id)
+            self.pool.discard(room.room_id)
+
+
+class RoomPool:
+    """Живые комнаты со случайным выбором за O(1)"""
+
+    def __init__(self):
+        self.items = []
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, room_id):
+        self.positions[room_id] = len(self.items)
+        self.items.append(room_id)
+
+    def discard(self, room_id):
+        position = self.positions.pop(room_id, None)
+        if position is None:
+            return
+
+        last = self.items.pop()
+        if position < len(self.items):
+            self.items[position] = last
+            self.positions[last] = position
+
+    def choice(self, rng: random.Random):
+        return self.items[rng.randrange(len(self.items))]
+
+
+def deep_size(value, seen: set) -> int:
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_size(key, seen) + deep_size(item, seen) for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(deep_size(item, seen) for item in value)
+
+    return size
+
+
+def scheduler_memory(scheduler: ExpiryScheduler) -> int:
+    seen = set()
+    return deep_size(scheduler.deadlines, seen) + deep_size(scheduler._heap, seen)
+
+
+async def simulate(args, clock: VirtualClock):
+    rng = random.Random(args.seed)
+    rooms = SimRooms()
+    pool = RoomPool()
+    tracker = Tracker(args.tolerance)
+    stats = SimpleNamespace(cpu_time=0.0, operations=0, peak_rooms=0, memory_per_room=0.0)
+
+    def new_scheduler():
+        scheduler = SimulatedScheduler(tracker, rooms, pool, stats)
+        tasks.expiry_scheduler = scheduler
+        return scheduler
+
+    scheduler = new_scheduler()
+    scheduler.start(None, rooms)
+
+    kinds, weights = list(EVENT_WEIGHTS), list(EVENT_WEIGHTS.values())
+    restart_every = args.events // (args.restarts + 1) if args.restarts else 0
+    counts = Counter()
+    started_at, wall_started_at = clock.time(), time.perf_counter()
+
+    for index in range(1, args.events + 1):
+        await asyncio.sleep(rng.expovariate(args.rate))
+
+        # Замер до события: перезапуск обнуляет структуры планировщика
+        stats.peak_rooms = max(stats.peak_rooms, len(pool))
+        if index % args.memory_every == 0 or index == args.events:
+            memory_per_room = scheduler_memory(scheduler) / max(len(scheduler), 1)
+            stats.memory_per_room = max(stats.memory_per_room, memory_per_room)
+
+        if restart_every and index % restart_every == 0:
+            # Процесс упал: состояние планировщика потеряно, после простоя - восстановление как при запуске
+            counts['restart'] += 1
+            scheduler._on_lease_lost()
+            tracker.on_stop()
+            await asyncio.sleep(rng.uniform(0, args.max_downtime))
+
+            scheduler = new_scheduler()
+            tracker.on_restore()
+            await tasks.restore_auto_deletion_tasks(None, rooms)
+            continue
+
+        kind = rng.choices(kinds, weights)[0] if pool else 'create'
+        counts[kind] += 1
+
+        if kind == 'create':
+            room_id = ObjectId()
+            rooms.insert(room_id, expires_after(LIFE_TIME))
+            pool.add(room_id)
+            tracker.open(room_id, now_timestamp() + LIFE_TIME)
+            await tasks.schedule_auto_delete(None, room_id, LIFE_TIME, rooms)
+        elif kind == 'update':
+            room_id = pool.choice(rng)
+            expires_at = expires_after(LIFE_TIME)
+            rooms.documents[room_id]['expires_at'] = expires_at
+            tracker.reschedule(room_id, to_timestamp(expires_at))
+            await tasks.reschedule_auto_delete(None, room_id, expires_at, rooms)
+        else:
+            room_id = pool.choice(rng)
+            del rooms.documents[room_id]
+            pool.discard(room_id)
+            tracker.cancel(room_id)
+            tasks.cancel_auto_delete(room_id)
+
+    events_span = clock.time() - started_at
+    cpu_time, operations = stats.cpu_time, stats.operations
+
+    # Без новых событий все оставшиеся комнаты должны истечь
+    await asyncio.sleep(LIFE_TIME + EXPIRY_HORIZON)
+    for room_id in list(tracker.epochs):
+        tracker.close(room_id, clock.time())
+    task = scheduler._task
+    scheduler._on_lease_lost()
+    await asyncio.gather(task, return_exceptions=True)
+
+    return SimpleNamespace(
+        counts=counts, tracker=tracker, stats=stats, events_span=events_span,
+        wall_time=time.perf_counter() - wall_started_at, cpu_time=cpu_time, operations=operations
+    )
+
+
+def report(args, result):
+    tracker = result.tracker
+    live_room_hours = result.stats.peak_rooms * result.events_span / 3600
+
+    print(f"Событий: {args.events} ({dict(result.counts)}) за {result.events_span / 3600:.1f} ч виртуального "
+          f"времени, {result.wall_time:.1f} с реального")
+    print(f"Предупреждений: {tracker.warnings}, удалений планировщиком: {tracker.deletions}, "
+          f"из них истекших за простой: {tracker.restore_deletions}")
+    print(f"Пик живых комнат: {result.stats.peak_rooms}")
+    print(f"Планировщик: {result.cpu_time:.2f} с процессора, {result.cpu_time / max(result.operations, 1) * 1e6:.2f} мкс "
+          f"на операцию, ~{result.cpu_time / max(live_room_hours, 1e-9) * 1e6:.1f} мкс на комнату-час при пике")
+    print(f"Память планировщика: ~{result.stats.memory_per_room:.0f} байт на живую комнату (куча и словарь дедлайнов)")
+
+    if not tracker.errors:
+        print("\nОшибок нет: каждое предупреждение и удаление сработало ровно один раз и вовремя")
+        return True
+
+    print("\nОшибки:")
+    for kind, count in tracker.errors.most_common():
+        print(f"  {kind}: {count}, например: {'; '.join(tracker.examples[kind])}")
+
+    return False
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Симуляция авто-удаления комнат в виртуальном времени")
+    parser.add_argument('--events', type=int, default=1_000_000)
+    parser.add_argument('--rate', type=float, default=20, help="событий в секунду виртуального времени")
+    parser.add_argument('--restarts', type=int, default=20, help="перезапусков бота за симуляцию")
+    parser.add_argument('--max-downtime', type=float, default=600, help="наибольший простой при перезапуске, с")
+    parser.add_argument('--tolerance', type=float, default=1, help="допуск срабатывания, с")
+    parser.add_argument('--memory-every', type=int, default=100_000, help="как часто замерять память, событий")
+    parser.add_argument('--seed', type=int, default=0)
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    clock = VirtualClock()
+    previous_clock = set_clock(clock)
+    loop = VirtualTimeLoop(clock)
+
+    try:
+        result = loop.run_until_complete(simulate(args, clock))
+    finally:
+        loop.close()
+        set_clock(previous_clock)
+
+    sys.exit(0 if report(args, result) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Генераторы апдейтов для нагрузочных тестов.
+
+Апдейты собираются в том виде, в каком их присылает Telegram, и подаются в настоящий
+dp через feed_raw_update. Сценарий - это последовательность шагов одного пользователя
+(например, весь диалог /add); шаги одного сценария идут строго друг за другом.
+"""
+import itertools
+import time
+
+from src.models import Map, GameMode
+
+
+class UpdateFactory:
+    def __init__(self):
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    @staticmethod
+    def user(user_id: int) -> dict:
+        return {'id': user_id, 'is_bot': False, 'first_name': f"user{user_id}"}
+
+    @staticmethod
+    def chat(chat_id: int) -> dict:
+        return {'id': chat_id, 'type': 'private' if chat_id > 0 else 'group'}
+
+    def message(self, user_id: int, text: str, chat_id: int = None) -> dict:
+        message = {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': self.chat(chat_id or user_id),
+            'from': self.user(user_id),
+            'text': text
+        }
+        if text.startswith('/'):
+            command = text.split()[0]
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+
+        return {'update_id': next(self._update_ids), 'message': message}
+
+    def callback_query(self, user_id: int, data: str, message_id: int = 1, chat_id: int = None) -> dict:
+        return {
+            'update_id': next(self._update_ids),
+            'callback_query': {
+                'id': str(next(self._update_ids)),
+                'from': self.user(user_id),
+                'chat_instance': str(chat_id or user_id),
+                'data': data,
+                'message': {
+                    'message_id': message_id,
+                    'date': int(time.time()),
+                    'chat': self.chat(chat_id or user_id),
+                    'text': "..."
+                }
+            }
+        }
+
+
+# Просмотр списка: /list и переход на следующую страницу
+def list_scenario(factory: UpdateFactory, user_id: int):
+    yield factory.message(user_id, "/list")
+    yield factory.callback_query(user_id, "page_1")
+
+
+# Поиск: /find без фильтров
+def find_scenario(factory: UpdateFactory, user_id: int):
+    yield factory.message(user_id, "/find")
+
+
+# Полный диалог добавления комнаты пользователем без комнаты
+def add_scenario(factory: UpdateFactory, user_id: int):
+    maps, game_modes = list(Map), list(GameMode)
+
+    yield factory.message(user_id, "/add")
+    yield factory.message(user_id, f"L{user_id:06d}"[-7:])
+    yield factory.message(user_id, f"host{user_id}"[:15])
+    yield factory.message(user_id, maps[user_id % len(maps)].value)
+    yield factory.message(user_id, game_modes[user_id % len(game_modes)].value)
+
+
+# Запуск рассылки администратором
+def broadcast_scenario(factory: UpdateFactory, user_id: int):
+    yield factory.message(user_id, "/broadcast")
+    yield factory.message(user_id, "Нагрузочный тест рассылки")
+
+
+SCENARIOS = {
+    'list': list_scenario,
+    'find': find_scenario,
+    'add': add_scenario
+}
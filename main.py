@@ -1,13 +1,82 @@
+import asyncio
+import time
+
+# Отсчет холодного старта до импорта модулей бота: в разбивку попадает и загрузка aiogram, Motor, обработчиков
+STARTED_AT = time.monotonic()
+
+from src.config import UPDATES_MODE, METRICS_HOST, METRICS_PORT
 from src.tasks import restore_auto_deletion_tasks
+from src.acl import admin_acl
+from src.room_index import room_index
+from src.bootstrap import StartupTimer, bootstrap
+from src.webhook import run_webhook
+from src.metrics import registry, start_metrics_server
+from src.tasks import expiry_scheduler
+from src.notifications import notification_dispatcher
+from src.broadcast import broadcast_tasks
 
 from src.controller import *
 
 
+startup_timer = StartupTimer(STARTED_AT)
+
+
+# Показатели, которые снимаются в момент запроса /metrics
+def register_gauges():
+    registry.gauge('bot_scheduled_rooms', 'Комнаты в очереди планировщика удаления', lambda: len(expiry_scheduler))
+    registry.gauge('bot_expiry_leader', 'Процесс держит аренду планировщика', lambda: int(expiry_scheduler.is_leader))
+    registry.gauge('bot_live_rooms', 'Живые комнаты в индексе поиска', lambda: len(room_index))
+    registry.gauge('bot_notification_queue', 'Уведомления в очереди отправки', notification_dispatcher.queue.qsize)
+    registry.gauge('bot_broadcasts', 'Идущие рассылки', lambda: len(broadcast_tasks))
+    registry.gauge('bot_startup_seconds', 'От старта процесса до готовности к приему апдейтов',
+                   lambda: startup_timer.ready_after or float('nan'))
+    registry.gauge('bot_first_update_seconds', 'От старта процесса до первого обработанного апдейта',
+                   lambda: startup_timer.first_update_after or float('nan'))
+
+
+# Фоновые задачи процесса: ссылки на них держим до остановки бота
+background_tasks = set()
+
+
+def start_background_task(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
+async def stop_background_tasks():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+
+
 # Запуск бота
 async def main():
-    await bot.delete_webhook(drop_pending_updates=True)
-    await restore_auto_deletion_tasks(bot, rooms_collection) # Восстановить отслеживания при запуске
-    await dp.start_polling(bot)
+    metrics_server = None
+    if METRICS_PORT:
+        register_gauges()
+        metrics_server = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+
+    await bootstrap(startup_timer)
+    start_background_task(admin_acl.watch())  # Синхронизация списка администраторов между процессами
+    # Комнаты, истекшие за время простоя, удалит планировщик в фоне вместе с ближайшими дедлайнами
+    await restore_auto_deletion_tasks(bot, rooms_collection)
+    start_background_task(room_index.watch())  # Изменения комнат из других процессов
+
+    startup_timer.ready()
+
+    try:
+        if UPDATES_MODE == "webhook":
+            await run_webhook(bot, dp)
+        else:
+            # Апдейты, накопившиеся за время перезапуска, не сбрасываем
+            await bot.delete_webhook(drop_pending_updates=False)
+            await dp.start_polling(bot)
+    finally:
+        await stop_background_tasks()
+        await expiry_scheduler.stop()
+        if metrics_server is not None:
+            await metrics_server.cleanup()
 
 if __name__ == '__main__':
     logger.info("Запуск бота")
@@ -0,0 +1,56 @@
+import logging
+from aiogram import types
+from aiogram.filters import Filter
+
+from src.change_stream import watch_collection
+from src.config import ADMIN_ID, users_collection
+
+logger = logging.getLogger(__name__)
+
+
+# Список администраторов в памяти: проверка прав без обращений к базе
+class AdminACL:
+    def __init__(self, root_id):
+        self.root_id = int(root_id) if str(root_id).isdigit() else None
+        self.admin_ids = set()
+
+    def is_root(self, user_id: int) -> bool:
+        return user_id == self.root_id
+
+    def is_admin(self, user_id: int) -> bool:
+        return user_id == self.root_id or user_id in self.admin_ids
+
+    def grant(self, user_id: int):
+        self.admin_ids.add(user_id)
+
+    def revoke(self, user_id: int):
+        self.admin_ids.discard(user_id)
+
+    async def load(self):
+        self.admin_ids = {
+            user['user_id'] async for user in users_collection.find({'is_admin': True}, {'user_id': 1})
+        }
+        logger.info(f"Загружено администраторов: {len(self.admin_ids)}")
+
+    def apply_change(self, change):
+        user = change.get('fullDocument')
+        if user is None:
+            return
+
+        if user.get('is_admin'):
+            self.grant(user['user_id'])
+        else:
+            self.revoke(user['user_id'])
+
+    # Права, выданные и снятые в других процессах (нужен replica set)
+    async def watch(self):
+        pipeline = [{'$match': {'operationType': {'$in': ['insert', 'update', 'replace']}}}]
+        await watch_collection(users_collection, "списка администраторов", self.apply_change, self.load, pipeline)
+
+
+admin_acl = AdminACL(ADMIN_ID)
+
+
+class IsAdmin(Filter):
+    async def __call__(self, message: types.Message) -> bool:
+        return admin_acl.is_admin(message.from_user.id)
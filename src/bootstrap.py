@@ -0,0 +1,102 @@
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from src.config import settings, dp, users_collection
+from src.acl import admin_acl
+from src.cache import users_cache, CACHE_MAX_SIZE, ROOM_CARDS_MAX_SIZE
+from src.content import content_store
+from src.database import ensure_indexes, migrate_rooms_expires_at, migrate_rooms_owner_keys, \
+    migrate_rooms_unique_codes, migrate_users_ratings
+from src.models import User
+from src.render import render_room
+from src.room_index import room_index
+
+logger = logging.getLogger(__name__)
+
+
+# Длительность этапов запуска: от старта процесса до готовности и до первого апдейта
+class StartupTimer:
+    def __init__(self, started_at: float):
+        self.started_at = started_at  # time.monotonic() в момент старта процесса
+        self.steps = []  # (этап, секунды)
+        self.ready_after = None
+        self.first_update_after = None
+        self._step_started_at = started_at
+
+    # Этап длится от конца предыдущего: так в разбивку попадает и импорт модулей до первого этапа
+    def mark(self, name: str):
+        now = time.monotonic()
+        self.steps.append((name, now - self._step_started_at))
+        self._step_started_at = now
+
+    async def step(self, name: str, awaitable: Awaitable):
+        result = await awaitable
+        self.mark(name)
+        return result
+
+    def ready(self):
+        self.ready_after = time.monotonic() - self.started_at
+        breakdown = ", ".join(f"{name} {seconds * 1000:.0f} мс" for name, seconds in self.steps)
+        logger.info(f"Бот готов к приему апдейтов через {self.ready_after:.2f} с после старта: {breakdown}")
+
+    def first_update(self):
+        self.first_update_after = time.monotonic() - self.started_at
+        logger.info(f"Первый апдейт обработан через {self.first_update_after:.2f} с после старта")
+
+
+# Отмечает в StartupTimer первый обработанный апдейт
+class FirstUpdateMiddleware(BaseMiddleware):
+    def __init__(self, timer: StartupTimer):
+        self.timer = timer
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        try:
+            return await handler(event, data)
+        finally:
+            if self.timer.first_update_after is None:
+                self.timer.first_update()
+
+
+# Карточки самых свежих комнат и их владельцы: первые /list и оценки не ждут базу
+async def warm_caches():
+    rooms, _ = room_index.search("", limit=ROOM_CARDS_MAX_SIZE)
+    for room in rooms:
+        render_room(room)
+
+    owner_ids = list({room.owner_id for room in rooms})[:CACHE_MAX_SIZE]
+    async for user_data in users_collection.find({'user_id': {'$in': owner_ids}}):
+        users_cache.set(user_data['user_id'], User.from_dict(user_data))
+
+    logger.info(f"Прогрев кэшей: карточек комнат {len(rooms)}, пользователей {len(users_cache)}")
+
+
+# Однократная подготовка перед приемом апдейтов: миграции, индексы, загрузка данных в память
+async def bootstrap(timer: StartupTimer):
+    timer.mark("импорт и настройки")
+
+    await timer.step("миграции комнат", migrate_rooms_expires_at())
+    await timer.step("миграции ключей владельцев", migrate_rooms_owner_keys())
+    await timer.step("уникальные коды", migrate_rooms_unique_codes())
+    await timer.step("индексы", ensure_indexes())
+    await timer.step("миграция оценок", migrate_users_ratings())
+
+    content_store.load()
+    content_store.start_watching()  # Подхват правок в папке info без перезапуска
+    timer.mark("тексты")
+
+    await timer.step("администраторы", admin_acl.load())
+    await timer.step("индекс комнат", room_index.load())
+
+    if settings.warm_caches:
+        await timer.step("прогрев кэшей", warm_caches())
+
+    dp.update.outer_middleware(FirstUpdateMiddleware(timer))
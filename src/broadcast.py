@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import time
+from aiogram import Bot
+from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest
+from pymongo.errors import PyMongoError
+
+from src.config import chats_collection
+from src.cache import chats_cache
+from src.notifications import send_limited, is_dead_chat_error
+
+logger = logging.getLogger(__name__)
+
+# Количество одновременных отправок
+BROADCAST_CONCURRENCY = 20
+# Как часто обновлять сообщение с прогрессом, в секундах
+PROGRESS_INTERVAL = 5
+# Размер пачки неактивных чатов для удаления из базы
+PRUNE_BATCH_SIZE = 500
+
+# Ссылки на запущенные рассылки, чтобы задачи не собрал сборщик мусора
+broadcast_tasks = set()
+
+
+class BroadcastStats:
+    def __init__(self, total: int):
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.pruned = 0
+        self.started_at = time.monotonic()
+
+    @property
+    def done(self):
+        return self.sent + self.failed + self.pruned
+
+    def eta(self):
+        elapsed = time.monotonic() - self.started_at
+        if self.done == 0:
+            return None
+
+        return (self.total - self.done) * elapsed / self.done
+
+    def report(self, finished=False):
+        title = "✅ <b>Рассылка завершена</b>" if finished else "📣 <b>Идёт рассылка</b>"
+        output = (
+            f"{title}\n\n"
+            f"Обработано: <b>{self.done}</b> из <b>{self.total}</b>\n"
+            f"Отправлено: <b>{self.sent}</b>\n"
+            f"Ошибок: <b>{self.failed}</b>\n"
+            f"Удалено неактивных чатов: <b>{self.pruned}</b>"
+        )
+
+        eta = self.eta()
+        if not finished and eta is not None:
+            output += f"\n\nОсталось примерно: <b>{int(eta // 60)} мин {int(eta % 60)} сек</b>"
+
+        return output
+
+
+# Ошибка удаления не прерывает рассылку: такие чаты удалятся при следующей рассылке
+async def prune_chats(chat_ids):
+    if not chat_ids:
+        return
+
+    try:
+        await chats_collection.delete_many({'chat_id': {'$in': chat_ids}})
+    except PyMongoError as e:
+        logger.error(f"Не удалось удалить из базы {len(chat_ids)} неактивных чатов: {e}")
+        return
+
+    for chat_id in chat_ids:
+        chats_cache.invalidate(chat_id)
+    logger.info(f"Из базы удалено {len(chat_ids)} неактивных чатов")
+
+
+async def run_broadcast(bot: Bot, admin_chat_id: int, text: str):
+    stats = BroadcastStats(await chats_collection.count_documents({}))
+    progress_message = await bot.send_message(admin_chat_id, stats.report(), parse_mode=ParseMode.HTML)
+    queue = asyncio.Queue(maxsize=BROADCAST_CONCURRENCY * 2)
+    dead_chats = []
+
+    async def send(chat_id):
+        try:
+            await send_limited(bot, chat_id, text)
+            stats.sent += 1
+        except Exception as e:
+            if is_dead_chat_error(e):
+                dead_chats.append(chat_id)
+                stats.pruned += 1
+            else:
+                stats.failed += 1
+                logger.error(f"Не удалось отправить сообщение пользователю {chat_id}: {e}")
+
+        if len(dead_chats) >= PRUNE_BATCH_SIZE:
+            batch = dead_chats[:]
+            dead_chats.clear()
+            await prune_chats(batch)
+
+    # Ошибка на одном чате не должна останавливать воркер: его доля очереди осталась бы без отправки
+    async def worker():
+        while (chat_id := await queue.get()) is not None:
+            try:
+                await send(chat_id)
+            except Exception as e:
+                logger.error(f"Ошибка рассылки в чат {chat_id}: {e}")
+
+    async def reporter():
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            try:
+                await progress_message.edit_text(stats.report(), parse_mode=ParseMode.HTML)
+            except TelegramBadRequest:
+                pass
+
+    workers = [asyncio.create_task(worker()) for _ in range(BROADCAST_CONCURRENCY)]
+    reporter_task = asyncio.create_task(reporter())
+
+    try:
+        async for chat in chats_collection.find({}, {'chat_id': 1}):
+            await queue.put(chat['chat_id'])
+        for _ in workers:
+            await queue.put(None)
+
+        await asyncio.gather(*workers)
+        await prune_chats(dead_chats)
+    finally:
+        # Если оборвался обход чатов, воркеры ждали бы очередь вечно
+        for task in workers + [reporter_task]:
+            task.cancel()
+        await asyncio.gather(*workers, reporter_task, return_exceptions=True)
+
+    logger.info(f"Рассылка завершена: отправлено {stats.sent}, ошибок {stats.failed}, удалено чатов {stats.pruned}")
+    await progress_message.edit_text(stats.report(finished=True), parse_mode=ParseMode.HTML)
+
+
+# Запуск рассылки фоновой задачей, обработчик администратора не ждет ее окончания
+def start_broadcast(bot: Bot, admin_chat_id: int, text: str):
+    task = asyncio.create_task(run_broadcast(bot, admin_chat_id, text))
+    broadcast_tasks.add(task)
+    task.add_done_callback(on_broadcast_done)
+
+    return task
+
+
+def on_broadcast_done(task: asyncio.Task):
+    broadcast_tasks.discard(task)
+
+    if not task.cancelled() and task.exception():
+        logger.error(f"Рассылка прервана из-за ошибки: {task.exception()}")
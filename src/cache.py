@@ -0,0 +1,67 @@
+import time
+from collections import OrderedDict
+
+# Параметры кэша пользователей и чатов
+CACHE_MAX_SIZE = 10_000
+CACHE_TTL = 60 * 5
+# Отрисованных карточек комнат: живых комнат немного, устаревшие версии вытесняются по LRU
+ROOM_CARDS_MAX_SIZE = 2_000
+
+
+# Ограниченный LRU кэш с временем жизни записей и счетчиками попаданий
+class TTLCache:
+    def __init__(self, name: str, maxsize: int = CACHE_MAX_SIZE, ttl: float = CACHE_TTL):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()  # key -> (expires_at, value)
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        item = self._items.get(key)
+
+        if item is None or item[0] < time.monotonic():
+            self._items.pop(key, None)
+            self.misses += 1
+            return None
+
+        self._items.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    # Значение без учета в статистике и без продления LRU, для сквозной записи
+    def peek(self, key):
+        item = self._items.get(key)
+        return item[1] if item is not None and item[0] >= time.monotonic() else None
+
+    def set(self, key, value):
+        self._items[key] = (time.monotonic() + self.ttl, value)
+        self._items.move_to_end(key)
+
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def invalidate(self, key):
+        self._items.pop(key, None)
+
+    def clear(self):
+        self._items.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'name': self.name,
+            'size': len(self._items),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+
+users_cache = TTLCache('users')
+chats_cache = TTLCache('chats')
+room_cards_cache = TTLCache('room_cards', maxsize=ROOM_CARDS_MAX_SIZE)
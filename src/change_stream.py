@@ -0,0 +1,51 @@
+import asyncio
+import logging
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Пауза перед переподключением к change stream, в секундах: удваивается до WATCH_RETRY_MAX_DELAY
+WATCH_RETRY_DELAY = 1
+WATCH_RETRY_MAX_DELAY = 60
+# Код ошибки MongoDB, когда resume token уже вытеснен из oplog
+CHANGE_STREAM_HISTORY_LOST = 286
+
+
+# Передает события коллекции в handle, после сетевых ошибок и смены primary продолжает с последнего
+# resume token; если история потеряна, вызывает resync и начинает заново. Возвращается, только если
+# change stream не открылся ни разу (отдельный сервер без replica set)
+async def watch_collection(collection, name: str, handle, resync, pipeline=None):
+    resume_token = None
+    needs_resync = False
+    supported = False
+    delay = WATCH_RETRY_DELAY
+
+    while True:
+        try:
+            if needs_resync:
+                await resync()
+                needs_resync = False
+
+            async with collection.watch(pipeline, full_document='updateLookup', resume_after=resume_token) as stream:
+                supported, delay = True, WATCH_RETRY_DELAY
+                async for change in stream:
+                    handle(change)
+                    resume_token = stream.resume_token
+        except PyMongoError as e:
+            if isinstance(e, OperationFailure) and e.code == CHANGE_STREAM_HISTORY_LOST:
+                logger.warning(f"Change stream для {name} потерял историю, данные загружаются заново")
+                resume_token, needs_resync = None, True
+                continue
+            if isinstance(e, OperationFailure) and not supported:
+                logger.info(f"Change stream для {name} недоступен: {e}")
+                return
+
+            logger.warning(f"Change stream для {name} прерван, повтор через {delay} с: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, WATCH_RETRY_MAX_DELAY)
+            continue
+
+        # Поток закрылся сам (коллекцию удалили или переименовали): после invalidate начинаем заново
+        logger.warning(f"Change stream для {name} закрыт, повтор через {delay} с")
+        resume_token, needs_resync = None, True
+        await asyncio.sleep(delay)
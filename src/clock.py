@@ -0,0 +1,58 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+
+# Настоящее время: секунды Unix
+class SystemClock:
+    def time(self) -> float:
+        return time.time()
+
+
+# Время, которое идет только по команде: для симуляций без ожидания
+class VirtualClock:
+    def __init__(self, start: float = None):
+        self.start = time.time() if start is None else start
+        self.elapsed = 0.0
+
+    def time(self) -> float:
+        return self.start + self.elapsed
+
+    # Аналог time.monotonic: небольшие значения без потери точности на сложении с временем Unix
+    def monotonic(self) -> float:
+        return self.elapsed
+
+    def advance(self, seconds: float):
+        if seconds > 0:
+            self.elapsed += seconds
+
+
+clock = SystemClock()
+
+
+# Подмена часов для всего, что берет время через этот модуль; возвращает прежние часы
+def set_clock(new_clock):
+    global clock
+    previous, clock = clock, new_clock
+
+    return previous
+
+
+def now_timestamp() -> float:
+    return clock.time()
+
+
+def utc_now() -> datetime:
+    return from_timestamp(clock.time())
+
+
+# Момент через delay секунд (наивное UTC время, как его хранит MongoDB)
+def expires_after(delay) -> datetime:
+    return utc_now() + timedelta(seconds=delay)
+
+
+def to_timestamp(value: datetime) -> float:
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def from_timestamp(value: float) -> datetime:
+    return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
@@ -1,34 +1,94 @@
 import logging
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.fsm.storage.memory import MemoryStorage
-from dotenv import dotenv_values
 from motor.motor_asyncio import AsyncIOMotorClient
 
+from src.log import setup_logging
+from src.settings import load_settings
+from src.storage import MongoStorage, FSMFlushMiddleware
+from src.metrics import MetricsMiddleware, BotAPIMetricsMiddleware, InstrumentedCollection
+from src.throttling import ThrottlingMiddleware, CallbackCollapseMiddleware, MESSAGE_USER_RATE, MESSAGE_USER_BURST, \
+    MESSAGE_CHAT_RATE, MESSAGE_CHAT_BURST, CALLBACK_USER_RATE, CALLBACK_USER_BURST, CALLBACK_CHAT_RATE, \
+    CALLBACK_CHAT_BURST
 
-# Настройка логгирования
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-logger = logging.getLogger(__name__)
 
-# Добавление FileHandler для записи логов в файл
-file_handler = logging.FileHandler('bot.log')
-file_handler.setLevel(logging.INFO)
-file_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-file_handler.setFormatter(file_formatter)
-logger.addHandler(file_handler)
+# Все настройки из .env разбираются и проверяются один раз
+settings = load_settings()
+
+# Настройка логгирования: запись в консоль и файл (JSON с ротацией) идет в фоновом потоке
+LOG_FILE = settings.log_file
+LOG_MAX_BYTES = settings.log_max_bytes
+LOG_BACKUP_COUNT = settings.log_backup_count
+LOG_ROTATE_WHEN = settings.log_rotate_when
+LOG_SAMPLE_RATE = settings.log_sample_rate
+
+log_listener = setup_logging(LOG_FILE, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_ROTATE_WHEN, LOG_SAMPLE_RATE)
+logger = logging.getLogger(__name__)
 
 # Инициализация токена
-TOKEN = dotenv_values(".env")["API_TOKEN"]
-ADMIN_ID = dotenv_values(".env")["ADMIN_ID"]
-bot = Bot(token=TOKEN)
-storage = MemoryStorage()
-dp = Dispatcher(storage=storage)
+TOKEN = settings.api_token
+ADMIN_ID = settings.admin_id
+TELEGRAM_API_URL = settings.telegram_api_url
+
+if TELEGRAM_API_URL:
+    bot = Bot(token=TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)))
+else:
+    bot = Bot(token=TOKEN)
+
+# Счетчики и задержки запросов к Bot API по методам
+bot.session.middleware(BotAPIMetricsMiddleware())
 
+# Способ получения апдейтов: polling (по умолчанию) или webhook
+UPDATES_MODE = settings.updates_mode
+WEBHOOK_URL = settings.webhook_url
+WEBHOOK_SECRET = settings.webhook_secret
+WEBHOOK_HOST = settings.webhook_host
+WEBHOOK_PORT = settings.webhook_port
+WEBHOOK_PATH = settings.webhook_path
+UPDATE_WORKERS = settings.update_workers
+UPDATE_QUEUE_SIZE = settings.update_queue_size
+
+METRICS_HOST = settings.metrics_host
+METRICS_PORT = settings.metrics_port
+
+# Размер пула и таймауты соединений задаются в .env (MONGO_MAX_POOL_SIZE, MONGO_*_TIMEOUT_MS)
 mongo_client = AsyncIOMotorClient(
-    dotenv_values(".env")["MONGO_CLIENT"],
-    tlsAllowInvalidCertificates=True
+    settings.mongo_client,
+    tlsAllowInvalidCertificates=True,
+    **settings.mongo_options()
 )
-db = mongo_client['ggd']
+MONGO_DB = settings.mongo_db
+db = mongo_client[MONGO_DB]
+
+# Каждая операция с коллекциями замеряется по имени
+rooms_collection = InstrumentedCollection(db['rooms'])
+users_collection = InstrumentedCollection(db['users'])
+chats_collection = InstrumentedCollection(db['chats'])
+ratings_collection = InstrumentedCollection(db['ratings'])
+subscriptions_collection = InstrumentedCollection(db['subscriptions'])
+fsm_collection = InstrumentedCollection(db['fsm'])
+
+FSM_STORAGE = settings.fsm_storage
+
+if FSM_STORAGE == "memory":
+    storage = MemoryStorage()
+    dp = Dispatcher(storage=storage)
+else:
+    storage = MongoStorage(fsm_collection)
+    dp = Dispatcher(storage=storage)
+    dp.update.outer_middleware(FSMFlushMiddleware(storage))
+
+# Антифлуд: сначала схлопываются серии нажатий, затем действуют бюджеты на пользователя и чат
+dp.message.outer_middleware(ThrottlingMiddleware(
+    MESSAGE_USER_RATE, MESSAGE_USER_BURST, MESSAGE_CHAT_RATE, MESSAGE_CHAT_BURST
+))
+dp.callback_query.outer_middleware(CallbackCollapseMiddleware())
+dp.callback_query.outer_middleware(ThrottlingMiddleware(
+    CALLBACK_USER_RATE, CALLBACK_USER_BURST, CALLBACK_CHAT_RATE, CALLBACK_CHAT_BURST
+))
 
-rooms_collection = db['rooms']
-users_collection = db['users']
-chats_collection = db['chats']
+# Задержка и ошибки по обработчикам
+for observer in (dp.message, dp.callback_query, dp.inline_query):
+    observer.middleware(MetricsMiddleware())
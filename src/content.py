@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import os
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+INFO_DIR = Path(__file__).resolve().parent.parent / 'info'
+CONTENT_EXTENSION = '.txt'
+# Ограничение Telegram на длину одного сообщения
+MESSAGE_LIMIT = 4096
+# Как часто проверять изменения файлов, в секундах
+RELOAD_INTERVAL = 10
+
+
+# Разбиение текста на части не длиннее limit: по абзацам, затем по строкам, затем жестко
+def split_text(text: str, limit: int = MESSAGE_LIMIT):
+    chunks = []
+    current = ''
+
+    def append(part, separator):
+        nonlocal current
+        if not current:
+            current = part
+        elif len(current) + len(separator) + len(part) <= limit:
+            current += separator + part
+        else:
+            chunks.append(current)
+            current = part
+
+    for paragraph in text.split('\n\n'):
+        if len(paragraph) <= limit:
+            append(paragraph, '\n\n')
+            continue
+
+        for line in paragraph.split('\n'):
+            while len(line) > limit:
+                append(line[:limit], '\n')
+                line = line[limit:]
+            append(line, '\n')
+
+    if current or not chunks:
+        chunks.append(current)
+
+    return chunks
+
+
+# Тексты из папки info: загружаются один раз и хранятся уже разбитыми на сообщения
+class ContentStore:
+    def __init__(self, path: Path = INFO_DIR):
+        self.path = path
+        self.chunks = {}  # name -> [chunk, ...]
+        self.mtimes = {}  # name -> mtime
+        self._task = None
+
+    def _scan(self):
+        return {
+            entry.name[:-len(CONTENT_EXTENSION)]: entry.stat().st_mtime
+            for entry in os.scandir(self.path)
+            if entry.is_file() and entry.name.endswith(CONTENT_EXTENSION)
+        }
+
+    def _read(self, name):
+        with open(self.path / (name + CONTENT_EXTENSION), 'r') as f:
+            return split_text(f.read())
+
+    # Перечитывает только новые и измененные файлы, удаленные убирает из памяти
+    def reload(self):
+        mtimes = self._scan()
+        changed = [name for name, mtime in mtimes.items() if self.mtimes.get(name) != mtime]
+
+        for name in changed:
+            self.chunks[name] = self._read(name)
+        for name in set(self.chunks) - set(mtimes):
+            del self.chunks[name]
+
+        self.mtimes = mtimes
+        return changed
+
+    def load(self):
+        self.reload()
+        logger.info(f"Загружено текстов: {len(self.chunks)}")
+
+    def get(self, name: str):
+        if not self.mtimes:
+            self.load()
+
+        return self.chunks.get(name) or ["Файл не найден"]
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(RELOAD_INTERVAL)
+            try:
+                changed = await asyncio.to_thread(self.reload)
+                if changed:
+                    logger.info(f"Тексты перезагружены: {', '.join(changed)}")
+            except OSError as e:
+                logger.error(f"Не удалось перезагрузить тексты: {e}")
+
+    def start_watching(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._watch())
+
+
+content_store = ContentStore()
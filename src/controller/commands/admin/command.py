@@ -1,88 +1,57 @@
-from functools import wraps
 from aiogram.filters import Command
 from aiogram.enums import ParseMode
 from aiogram import types
 from aiogram.fsm.context import FSMContext
 
 from src.controller.handlers.states import AdminState
-from src.utils import get_content_file
-from src.config import dp, logger, ADMIN_ID, rooms_collection, users_collection
+from src.utils import answer_content
+from src.config import dp, logger, rooms_collection
 from src.keyboards import default_keyboard, cancel_keyboard
-from src.models import AnswerEnum, User
+from src.models import AnswerEnum
+from src.acl import IsAdmin, admin_acl
+from src.cache import users_cache, chats_cache, room_cards_cache
 
 
-async def is_admin(user_id: int):
-    admin_data = await users_collection.find_one({'user_id': user_id})
-
-    if (admin_data and User.from_dict(admin_data).is_admin) or user_id == ADMIN_ID:
-        return True
-
-    return False
-
-
-def is_root(user_id: int):
-    if str(user_id) != ADMIN_ID:
-        return False
-
-    return True
-
-
-# Декоратор-обертка для проверки прав
-def wrapper_root(handler):
-    @wraps(handler)
-    async def wrapper(message: types.Message, *args, **kwargs):
-        is_root_result = is_root(message.from_user.id)
-        if is_root_result:
-            return await handler(message, *args, **kwargs)
-        else:
-            is_admin_result = await is_admin(message.from_user.id)
-            if is_admin_result:
-                logger.info(f"Пользователь {message.from_user.id} является администратором")
-                return await handler(message, *args, **kwargs)
-            else:
-                logger.warning(f"Пользователь {message.from_user.id} не имеет прав администратора")
-                await message.answer(AnswerEnum.you_dont_have_root.value, parse_mode=ParseMode.HTML,
-                                     reply_markup=default_keyboard)
-
-    return wrapper
-
-
-@dp.message(Command("admin_help"))
-@wrapper_root
+@dp.message(Command("admin_help"), IsAdmin())
 async def admin_help(message: types.Message):
-    await message.answer(await get_content_file('admin_help'), parse_mode=ParseMode.HTML, reply_markup=default_keyboard)
+    await answer_content(message, 'admin_help', reply_markup=default_keyboard)
 
 
-@dp.message(Command("add_admin"))
-@wrapper_root
+@dp.message(Command("add_admin"), IsAdmin())
 async def add_admin(message: types.Message, state: FSMContext):
     await message.answer("Пожалуйста, отправьте id пользователя, которого вы хотите назначить администратором.", reply_markup=cancel_keyboard)
     await state.set_state(AdminState.add_admin)
 
 
-@dp.message(Command("list_admins"))
-@wrapper_root
+@dp.message(Command("list_admins"), IsAdmin())
 async def list_admins(message: types.Message):
     output = "<b>Список администраторов:</b>\n\n"
-    i = 1
-    async for users_data in users_collection.find({'is_admin': True}):
-        admin = User.from_dict(users_data)
+    for i, admin_id in enumerate(sorted(admin_acl.admin_ids), start=1):
         output += (
-            f"{i} <code>{admin.user_id}</code>\n"
+            f"{i} <code>{admin_id}</code>\n"
         )
-        i += 1
 
     await message.answer(output, parse_mode=ParseMode.HTML, reply_markup=default_keyboard)
 
 
-@dp.message(Command("del_admin"))
-@wrapper_root
-async def del_admin(message: types.Message, state: FSMContext):
-    users_cursor = users_collection.find({'is_admin': True})
-    admins = await users_cursor.to_list(length=None)
+@dp.message(Command("cache_stats"), IsAdmin())
+async def cache_stats(message: types.Message):
+    output = "<b>Статистика кэшей:</b>\n\n"
+    for cache in (users_cache, chats_cache, room_cards_cache):
+        stats = cache.stats()
+        output += (
+            f"<i>{stats['name']}</i>: записей <b>{stats['size']}</b>, "
+            f"попаданий <b>{stats['hits']}</b>, промахов <b>{stats['misses']}</b> "
+            f"({stats['hit_rate']:.0%})\n"
+        )
+
+    await message.answer(output, parse_mode=ParseMode.HTML, reply_markup=default_keyboard)
 
-    # Преобразование данных и создание кнопок
-    buttons = [types.KeyboardButton(text=str(admin['user_id'])) for admin in admins]
+
+@dp.message(Command("del_admin"), IsAdmin())
+async def del_admin(message: types.Message, state: FSMContext):
+    # Создание кнопок по списку администраторов
+    buttons = [types.KeyboardButton(text=str(admin_id)) for admin_id in sorted(admin_acl.admin_ids)]
     keyboard = types.ReplyKeyboardMarkup(
         keyboard=[buttons[i:i + 3] for i in range(0, len(buttons), 3)],
         resize_keyboard=True
@@ -97,8 +66,7 @@ async def del_admin(message: types.Message, state: FSMContext):
     await state.set_state(AdminState.del_admin)
 
 
-@dp.message(Command("admin_del"))
-@wrapper_root
+@dp.message(Command("admin_del"), IsAdmin())
 async def admin_delete_room(message: types.Message, state: FSMContext):
     rooms_cursor = rooms_collection.find()
     rooms = await rooms_cursor.to_list(length=None)
@@ -118,8 +86,15 @@ async def admin_delete_room(message: types.Message, state: FSMContext):
     await state.set_state(AdminState.delete_room)
 
 
-@dp.message(Command("broadcast"))
-@wrapper_root
+@dp.message(Command("broadcast"), IsAdmin())
 async def broadcast_message(message: types.Message, state: FSMContext):
     await message.answer("Пожалуйста, отправьте сообщение, которое будет отправлено пользователям", reply_markup=cancel_keyboard)
     await state.set_state(AdminState.broadcast_text)
+
+
+# Команды администратора от пользователей без прав: сюда попадают только апдейты, отклоненные фильтром IsAdmin
+@dp.message(Command("admin_help", "add_admin", "list_admins", "cache_stats", "del_admin", "admin_del", "broadcast"))
+async def deny_admin_command(message: types.Message):
+    logger.warning(f"Пользователь {message.from_user.id} не имеет прав администратора",
+                   extra={'user_id': message.from_user.id})
+    await message.answer(AnswerEnum.you_dont_have_root.value, parse_mode=ParseMode.HTML, reply_markup=default_keyboard)
@@ -1,46 +1,66 @@
 import logging
+import math
 
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command, CommandStart
 from aiogram.enums import ParseMode
 from aiogram import types, F
 from aiogram.fsm.context import FSMContext
 
-from src.config import dp, rooms_collection
+from src.config import dp, rooms_collection, subscriptions_collection
 from src.controller.handlers.states import RoomState
-from src.keyboards import default_keyboard, cancel_keyboard, create_keyboard, get_subscribe_keyboard
-from src.utils import get_content_file, get_user, get_chat, update_user_subscriptions, update_user_rating
-from src.models import Room, AnswerEnum, QueryCommand
+from src.keyboards import default_keyboard, cancel_keyboard, create_keyboard, get_rooms_page_keyboard, \
+    get_find_keyboard, get_find_choice_keyboard, find_filter_value
+from src.utils import answer_content, get_user, get_chat, update_user_subscriptions, update_user_rating
+from src.models import AnswerEnum, QueryCommand, Map, GameMode, ROOM_SUMMARY_PROJECTION
+from src.room_index import room_index
+from src.render import render_room, render_room_data
+
+ROOMS_PER_PAGE = 5
+# Результатов на одну порцию inline-выдачи (Telegram принимает не больше 50)
+INLINE_RESULTS_LIMIT = 20
+# Сколько секунд Telegram может отдавать закэшированный ответ на такой же inline-запрос
+INLINE_CACHE_TIME = 30
+
+# Сортировки поиска; обе обслуживаются составными индексами из ensure_indexes
+FIND_SORTS = {
+    'new': ('Сначала новые', [('created_at', -1)]),
+    'top': ('По рейтингу хоста', [('owner.likes', -1), ('created_at', -1)]),
+}
 
 
 @dp.message(Command("start"))
 @dp.message(CommandStart(deep_link=True))
 async def start(message: types.Message):
-    await message.answer(await get_content_file('start'), parse_mode=ParseMode.HTML, reply_markup=default_keyboard)
+    await answer_content(message, 'start', reply_markup=default_keyboard)
     await get_chat(message.chat.id)
 
 
 @dp.message(Command("help"))
 async def help(message: types.Message):
-    await message.answer(await get_content_file('help'), parse_mode=ParseMode.HTML, reply_markup=default_keyboard)
+    await answer_content(message, 'help', reply_markup=default_keyboard)
 
 
 @dp.message(Command("rules"))
 async def rules(message: types.Message):
-    await message.answer(await get_content_file('rules_1'), parse_mode=ParseMode.HTML)
-    await message.answer(await get_content_file('rules_2'), parse_mode=ParseMode.HTML, reply_markup=default_keyboard)
+    await answer_content(message, 'rules', reply_markup=default_keyboard)
 
 
 async def subscribe_management(callback_query: types.CallbackQuery, subscribe_action):
-    room = await rooms_collection.find_one({"code": callback_query.data.split("_")[1]})
+    # Для подписки нужен только владелец комнаты
+    room = await rooms_collection.find_one({"code": callback_query.data.split("_")[1]}, {'owner_id': 1})
     chat = await get_chat(callback_query.message.chat.id)
 
     if room is None:
         await callback_query.answer("Запись больше не акутальна, я не смогу провести действие")
         return
 
-    room = Room.from_dict(room)
+    await update_user_subscriptions(room['owner_id'], chat.chat_id, subscribe_action)
 
-    await update_user_subscriptions(room.owner, chat, room.code, subscribe_action)
+    # Кнопка из списка комнат: перерисовываем страницу, чтобы обновить состояние подписки
+    query_parts = callback_query.data.split("_")
+    if len(query_parts) > 2 and query_parts[2].isdigit():
+        await edit_rooms_page(callback_query, int(query_parts[2]))
 
     if subscribe_action:
         await callback_query.answer(f"Вы подписались на обновления хоста с ником {room.host}")
@@ -73,16 +93,12 @@ async def dislike_room(callback_query: types.CallbackQuery):
 @dp.message(Command("get_profile"))
 async def get_profile(message: types.Message):
     user = await get_user(message.from_user.id)
-    sub_count = len(user.subscribers) if user.subscribers else 0
-    rating_count = len(user.rating) if user.rating else 0
-    likes = sum(1 for rating in user.rating if rating.rating)
-    dislikes = sum(1 for rating in user.rating if not rating.rating)
 
     await message.reply((
         "<b>Информация по вашему профилю:</b>\n\n"
-        f"<i>Подписано чатов на вас</i>: <b>{sub_count}</b>\n"
-        f"<i>Пользователей, оценивших вас</i>: <b>{rating_count}</b>\n\n"
-        f"👍 <b>{likes}</b> / 👎 <b>{dislikes}</b>"
+        f"<i>Подписано чатов на вас</i>: <b>{user.subscriber_count}</b>\n"
+        f"<i>Пользователей, оценивших вас</i>: <b>{user.likes + user.dislikes}</b>\n\n"
+        f"👍 <b>{user.likes}</b> / 👎 <b>{user.dislikes}</b>"
     ), parse_mode=ParseMode.HTML, reply_markup=default_keyboard)
 
 
@@ -96,38 +112,186 @@ async def list_rooms_text(message: types.Message):
     await list_rooms(message)
 
 
-async def list_rooms(message: types.Message):
+# Сборка одной страницы списка комнат: текст и клавиатура
+async def render_rooms_page(chat_id: int, page: int = 0):
     rooms_count = await rooms_collection.count_documents({})
-    chat = await get_chat(message.chat.id)
 
     if rooms_count == 0:
+        return None
+
+    pages_count = math.ceil(rooms_count / ROOMS_PER_PAGE)
+    page = max(0, min(page, pages_count - 1))
+
+    rooms_cursor = rooms_collection.find({}, ROOM_SUMMARY_PROJECTION).sort('created_at', -1).skip(page * ROOMS_PER_PAGE).limit(ROOMS_PER_PAGE)
+    rooms = [render_room_data(room_data) async for room_data in rooms_cursor]
+
+    # Одна выборка по индексу подписок для всех хостов на странице
+    subscriptions_cursor = subscriptions_collection.find(
+        {'chat_id': chat_id, 'owner_id': {'$in': [room.owner_id for room in rooms]}},
+        {'owner_id': 1}
+    )
+    subscribed_owners = {subscription['owner_id'] async for subscription in subscriptions_cursor}
+
+    output = f"<b>Комнаты</b> (всего: {rooms_count})\n\n"
+    output += "\n\n".join(room.card for room in rooms)
+    output += f"\n\n{AnswerEnum.good_game.value}"
+
+    rows = [room.keyboard_row(room.owner_id in subscribed_owners, page) for room in rooms]
+
+    return output, get_rooms_page_keyboard(rows, page, pages_count)
+
+
+async def list_rooms(message: types.Message):
+    chat = await get_chat(message.chat.id)
+    rooms_page = await render_rooms_page(chat.chat_id)
+
+    if rooms_page is None:
         await message.answer(AnswerEnum.not_found_rooms.value, parse_mode=ParseMode.HTML, reply_markup=default_keyboard)
         return
 
-    async for room_data in rooms_collection.find():
-        room = Room.from_dict(room_data)
-        is_subscribed = chat.chat_id in [chat_item.chat_id for chat_item in room.owner.subscribers]
+    output, keyboard = rooms_page
+    await message.answer(output, parse_mode=ParseMode.HTML, reply_markup=keyboard)
 
-        # Подсчет лайков и дизлайков
-        likes = sum(1 for rating in room.owner.rating if rating.rating)
-        dislikes = sum(1 for rating in room.owner.rating if not rating.rating)
 
-        output = f"<i>Рейтинг: 👍 {likes} / 👎 {dislikes}</i>\n\n"
-        output += (
-            f"                         ╭    🚀  {room.map.value}\n"
-            f"<code>{room.code}</code>       --¦     👑  <b>{room.host}</b>\n"
-            f"                         ╰    🎲  {room.game_mode.value}"
-        )
-        await message.answer(output, parse_mode=ParseMode.HTML,
-                             reply_markup=get_subscribe_keyboard(room, is_subscribed))
+# Перелистывание страницы списка комнат на месте
+async def edit_rooms_page(callback_query: types.CallbackQuery, page: int):
+    rooms_page = await render_rooms_page(callback_query.message.chat.id, page)
+
+    if rooms_page is None:
+        output, keyboard = AnswerEnum.not_found_rooms.value, None
+    else:
+        output, keyboard = rooms_page
+
+    try:
+        await callback_query.message.edit_text(output, parse_mode=ParseMode.HTML, reply_markup=keyboard)
+    except TelegramBadRequest as e:
+        # Страница не изменилась с прошлого показа
+        if "message is not modified" not in str(e):
+            raise
+
+
+@dp.callback_query(F.data.startswith(f"{QueryCommand.page.value}_"))
+async def page_rooms(callback_query: types.CallbackQuery):
+    page = callback_query.data.split("_")[1]
+
+    if page.isdigit():
+        await edit_rooms_page(callback_query, int(page))
+
+    await callback_query.answer()
+
+
+# Фильтр поиска: неуказанное поле заменяется на $in по всем значениям перечисления,
+# чтобы любой набор фильтров шел по одному префиксу индекса (map, game_mode, ...) без сортировки в памяти
+def build_find_query(map_value, mode_value):
+    return {
+        'map': map_value if map_value else {'$in': [m.value for m in Map]},
+        'game_mode': mode_value if mode_value else {'$in': [gm.value for gm in GameMode]}
+    }
+
+
+# Сборка страницы результатов поиска: один индексный запрос, лишняя запись показывает наличие следующей страницы
+async def render_find_page(map_index: str = "x", mode_index: str = "x", sort: str = "new", page: int = 0):
+    sort = sort if sort in FIND_SORTS else "new"
+    sort_title, sort_keys = FIND_SORTS[sort]
+    map_value = find_filter_value(list(Map), map_index)
+    mode_value = find_filter_value(list(GameMode), mode_index)
+
+    rooms_cursor = rooms_collection.find(build_find_query(map_value, mode_value), ROOM_SUMMARY_PROJECTION) \
+        .sort(sort_keys).skip(page * ROOMS_PER_PAGE).limit(ROOMS_PER_PAGE + 1)
+    rooms = [render_room_data(room_data) async for room_data in rooms_cursor]
+    has_next = len(rooms) > ROOMS_PER_PAGE
+
+    output = (
+        "<b>Поиск комнат</b>\n"
+        f"<i>Карта: {map_value or 'любая'} · Режим: {mode_value or 'любой'} · {sort_title}</i>\n\n"
+    )
+
+    if rooms:
+        output += "\n\n".join(room.card for room in rooms[:ROOMS_PER_PAGE])
+        output += f"\n\n{AnswerEnum.good_game.value}"
+    else:
+        output += AnswerEnum.not_found.value
+
+    return output, get_find_keyboard(map_index, mode_index, sort, page, has_next)
+
+
+async def edit_find_message(callback_query: types.CallbackQuery, output: str, keyboard):
+    try:
+        await callback_query.message.edit_text(output, parse_mode=ParseMode.HTML, reply_markup=keyboard)
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            raise
+
+
+@dp.message(Command("find"))
+async def find_rooms(message: types.Message):
+    output, keyboard = await render_find_page()
+    await message.answer(output, parse_mode=ParseMode.HTML, reply_markup=keyboard)
+
+
+@dp.callback_query(F.data.startswith(f"{QueryCommand.find.value}_"))
+async def find_rooms_page(callback_query: types.CallbackQuery):
+    query_parts = callback_query.data.split("_")
+
+    if len(query_parts) == 5 and query_parts[4].isdigit():
+        _, map_index, mode_index, sort, page = query_parts
+        await edit_find_message(callback_query, *await render_find_page(map_index, mode_index, sort, int(page)))
+
+    await callback_query.answer()
+
+
+@dp.callback_query(F.data.startswith(f"{QueryCommand.find_map.value}_"))
+async def find_choose_map(callback_query: types.CallbackQuery):
+    _, mode_index, sort = callback_query.data.split("_")
+    keyboard = get_find_choice_keyboard(
+        list(Map), lambda index: f"{QueryCommand.find.value}_{index}_{mode_index}_{sort}_0"
+    )
+
+    await edit_find_message(callback_query, AnswerEnum.choose_map.value, keyboard)
+    await callback_query.answer()
+
+
+@dp.callback_query(F.data.startswith(f"{QueryCommand.find_mode.value}_"))
+async def find_choose_game_mode(callback_query: types.CallbackQuery):
+    _, map_index, sort = callback_query.data.split("_")
+    keyboard = get_find_choice_keyboard(
+        list(GameMode), lambda index: f"{QueryCommand.find.value}_{map_index}_{index}_{sort}_0"
+    )
+
+    await edit_find_message(callback_query, AnswerEnum.choose_game_mode.value, keyboard)
+    await callback_query.answer()
+
 
-    await message.answer("Приятной игры!", reply_markup=default_keyboard)
+# Inline-поиск: @бот <карта|режим|хост> из любого чата, ответ строится по индексу в памяти
+@dp.inline_query()
+async def inline_rooms(inline_query: types.InlineQuery):
+    offset = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+    rooms, has_next = room_index.search(inline_query.query, offset, INLINE_RESULTS_LIMIT)
+
+    results = [
+        types.InlineQueryResultArticle(
+            id=str(room.room_id),
+            title=f"{room.code} · {room.map.value}",
+            description=f"👑 {room.host} · 🎲 {room.game_mode.value} · 👍 {room.likes} / 👎 {room.dislikes}",
+            input_message_content=types.InputTextMessageContent(
+                message_text=render_room(room).card, parse_mode=ParseMode.HTML
+            )
+        )
+        for room in rooms
+    ]
+
+    # Выдача одинакова для всех пользователей, поэтому кэш Telegram общий (is_personal=False)
+    await inline_query.answer(
+        results,
+        cache_time=INLINE_CACHE_TIME,
+        is_personal=False,
+        next_offset=str(offset + INLINE_RESULTS_LIMIT) if has_next else ""
+    )
 
 
 @dp.message(Command("add"))
 async def add_room(message: types.Message, state: FSMContext):
-    user = await get_user(message.from_user.id)
-    user_room = await rooms_collection.find_one({'owner': user.to_dict()})
+    user_room = await rooms_collection.find_one({'owner_id': message.from_user.id}, {'code': 1})
 
     if user_room:
         await message.answer(f"У вас уже есть комната с кодом <code>{user_room['code']}</code>.\nХотите удалить её перед добавлением новой?",
@@ -142,8 +306,7 @@ async def add_room(message: types.Message, state: FSMContext):
 
 @dp.message(Command("del"))
 async def delete_room(message: types.Message, state: FSMContext):
-    user = await get_user(message.from_user.id)
-    user_rooms_cursor = rooms_collection.find({'owner': user.to_dict()})
+    user_rooms_cursor = rooms_collection.find({'owner_id': message.from_user.id}, {'code': 1})
 
     user_rooms = await user_rooms_cursor.to_list(length=None)
 
@@ -164,8 +327,7 @@ async def delete_room(message: types.Message, state: FSMContext):
 
 @dp.message(Command("edit"))
 async def edit_room(message: types.Message, state: FSMContext):
-    user = await get_user(message.from_user.id)
-    user_rooms_cursor = rooms_collection.find({'owner': user.to_dict()})
+    user_rooms_cursor = rooms_collection.find({'owner_id': message.from_user.id}, {'code': 1})
 
     user_rooms = await user_rooms_cursor.to_list(length=None)
 
@@ -186,8 +348,7 @@ async def edit_room(message: types.Message, state: FSMContext):
 
 @dp.message(Command("update"))
 async def update_room(message: types.Message, state: FSMContext):
-    user = await get_user(message.from_user.id)
-    user_rooms_cursor = rooms_collection.find({'owner': user.to_dict()})
+    user_rooms_cursor = rooms_collection.find({'owner_id': message.from_user.id}, {'code': 1})
 
     user_rooms = await user_rooms_cursor.to_list(length=None)
 
@@ -1,18 +1,20 @@
-import asyncio
 from aiogram import types
 from aiogram.enums import ParseMode
 from aiogram.fsm.context import FSMContext
 from bson import ObjectId
-from datetime import datetime
+from pymongo.errors import DuplicateKeyError
 
 from src.controller.handlers.states import RoomState, AdminState
-from src.models import Room, ChooseEditEnum, AnswerEnum, Map, GameMode, Chat, User
+from src.models import Room, RoomSummary, ChooseEditEnum, AnswerEnum, Map, GameMode, User
 from src.keyboards import default_keyboard, cancel_keyboard, map_keyboard, game_mode_keyboard
-from src.config import dp, rooms_collection, logger, bot, users_collection, chats_collection
-from src.utils import validate_code, validate_host, get_user, get_chat
-from src.tasks import LIFE_TIME, auto_delete_tasks, schedule_auto_delete, \
-    reschedule_auto_delete, cancel_auto_delete
-from src.notifications import send_notification
+from src.config import dp, rooms_collection, logger, bot
+from src.utils import validate_code, validate_host, get_user, get_chat, get_subscribers, set_user_admin
+from src.clock import utc_now, expires_after
+from src.tasks import LIFE_TIME, schedule_auto_delete, reschedule_auto_delete, cancel_auto_delete
+from src.notifications import notify_subscribers
+from src.broadcast import start_broadcast
+from src.room_index import room_index
+from src.repository import update_room
 
 
 async def cancel(message: types.Message, state: FSMContext):
@@ -38,6 +40,11 @@ async def process_code(message: types.Message, state: FSMContext):
         await message.answer(AnswerEnum.error_code.value, parse_mode=ParseMode.HTML)
         return
 
+    # Ранняя проверка по уникальному индексу, чтобы не проходить весь диалог зря
+    if await rooms_collection.count_documents({'code': message.text.upper().strip()}, limit=1):
+        await message.answer(AnswerEnum.code_taken.value, parse_mode=ParseMode.HTML)
+        return
+
     await state.update_data(code=message.text)
     await message.answer(AnswerEnum.choose_host.value, reply_markup=cancel_keyboard, parse_mode=ParseMode.HTML)
     await state.set_state(RoomState.host)
@@ -94,28 +101,37 @@ async def process_game_mode(message: types.Message, state: FSMContext):
         game_mode=GameMode(message.text),
         owner=user_data,
         chat=chat_data,
-        created_at=datetime.now()
+        created_at=utc_now(),
+        expires_at=expires_after(LIFE_TIME)
     )
 
-    result = await rooms_collection.insert_one(room.to_dict())
+    try:
+        result = await rooms_collection.insert_one(room.to_dict())
+    except DuplicateKeyError:
+        # Код успели занять, пока пользователь выбирал карту и режим
+        await message.answer(AnswerEnum.code_taken.value, reply_markup=cancel_keyboard, parse_mode=ParseMode.HTML)
+        await state.set_state(RoomState.code)
+        return
+
     room_id = result.inserted_id
+    room.room_id = room_id
+    room_index.put(RoomSummary.from_room(room))
 
     # Планирование авто-удаления
-    task = asyncio.create_task(schedule_auto_delete(bot, room_id, LIFE_TIME, rooms_collection))
-    auto_delete_tasks[room_id] = task
+    await schedule_auto_delete(bot, room_id, LIFE_TIME, rooms_collection)
 
-    logger.info(f"Комната: {room.code} с индификаторм: {room_id} была добавлена пользователем {message.from_user.id}")
+    logger.info(f"Комната: {room.code} с индификаторм: {room_id} была добавлена пользователем {message.from_user.id}",
+                extra={'room_id': room_id, 'user_id': message.from_user.id})
 
     await state.clear()
     await message.answer(AnswerEnum.info_added_room.value, reply_markup=default_keyboard, parse_mode=ParseMode.HTML)
 
-    # Отправляем уведомления всем подписчикам
-    for chat in user_data.subscribers:
-        await send_notification(bot, chat.chat_id, (
-            f"🔔 <b>Уведомление об добавлении комнаты</b> 🔔\n\n"
-            f"Пользователь с ником <b>{room.host}</b> опубликовал комнату с кодом: <code>{room.code}</code>\n\n"
-            f"Вы получили это уведомление, потому что вы подписаны на обновления этого пользователя"
-        ))
+    # Ставим уведомления всем подписчикам в очередь
+    await notify_subscribers(bot, get_subscribers(user_data.user_id), (
+        f"🔔 <b>Уведомление об добавлении комнаты</b> 🔔\n\n"
+        f"Пользователь с ником <b>{room.host}</b> опубликовал комнату с кодом: <code>{room.code}</code>\n\n"
+        f"Вы получили это уведомление, потому что вы подписаны на обновления этого пользователя"
+    ), key=f"room_{user_data.user_id}")
 
 
 # Обработчики для редактирования комнаты
@@ -124,8 +140,7 @@ async def choose_edit_option(message: types.Message, state: FSMContext):
     if await is_press_cancel(message, state):
         return
 
-    user = await get_user(message.from_user.id)
-    room = await rooms_collection.find_one({'owner': user.to_dict(), 'code': message.text})
+    room = await rooms_collection.find_one({'owner_id': message.from_user.id, 'code': message.text})
 
     if room is None:
         await message.answer(AnswerEnum.not_found.value, reply_markup=default_keyboard, parse_mode=ParseMode.HTML)
@@ -172,6 +187,37 @@ async def edit_option(message: types.Message, state: FSMContext):
     await state.set_state(state_dict[option])
 
 
+# Общая часть редактирования: одна запись в базу вместе с продлением, затем планировщик и индекс поиска
+async def apply_room_edit(message: types.Message, state: FSMContext, field: str):
+    data = await state.get_data()
+    room_id = ObjectId(data['room_id'])
+
+    try:
+        room, changed = await update_room({'_id': room_id}, {field: message.text})
+    except DuplicateKeyError:
+        await message.answer(AnswerEnum.code_taken.value, parse_mode=ParseMode.HTML)
+        return None
+
+    await state.clear()
+
+    if room is None:
+        await message.answer(AnswerEnum.not_found.value, reply_markup=default_keyboard, parse_mode=ParseMode.HTML)
+        return None
+
+    if not changed:
+        await message.answer(AnswerEnum.nothing_changed.value, reply_markup=default_keyboard, parse_mode=ParseMode.HTML)
+        return None
+
+    await reschedule_auto_delete(bot, room_id, room.expires_at, rooms_collection)
+    room_index.put(RoomSummary.from_room(room))
+
+    await message.answer(AnswerEnum.success_edit.value, reply_markup=default_keyboard, parse_mode=ParseMode.HTML)
+    logger.info(f"Поле {field} комнаты {room_id} было изменено пользователем {message.from_user.id} на {message.text}",
+                extra={'room_id': room_id, 'user_id': message.from_user.id})
+
+    return room
+
+
 @dp.message(RoomState.edit_code)
 async def edit_code(message: types.Message, state: FSMContext):
     if await is_press_cancel(message, state):
@@ -181,26 +227,16 @@ async def edit_code(message: types.Message, state: FSMContext):
         await message.answer(AnswerEnum.error_code.value, parse_mode=ParseMode.HTML)
         return
 
-    data = await state.get_data()
-    room_id = ObjectId(data['room_id'])
-    await rooms_collection.update_one({'_id': room_id}, {'$set': {'code': message.text}})
-    room_data = await rooms_collection.find_one({'_id': room_id})
-    room = Room.from_dict(room_data)
-
-    await reschedule_auto_delete(bot, room_id, rooms_collection)
-
-    await state.clear()
-    await message.answer(AnswerEnum.success_edit.value, reply_markup=default_keyboard, parse_mode=ParseMode.HTML)
-
-    logger.info(f"Поле код комнаты {room_id} было изменено пользователем {message.from_user.id} на {message.text}")
+    room = await apply_room_edit(message, state, 'code')
+    if room is None:
+        return
 
-    # Отправляем уведомления всем подписчикам
-    for chat in room.owner.subscribers:
-        await send_notification(bot, chat.chat_id, (
-            f"🔔 <b>Уведомление об изменении комнаты</b> 🔔\n\n"
-            f"Пользователь с ником <b>{room.host}</b> изменил код: <code>{room.code}</code>\n\n"
-            f"Вы получили это уведомление, потому что вы подписаны на обновления этого пользователя"
-        ))
+    # Ставим уведомления всем подписчикам в очередь
+    await notify_subscribers(bot, get_subscribers(room.owner.user_id), (
+        f"🔔 <b>Уведомление об изменении комнаты</b> 🔔\n\n"
+        f"Пользователь с ником <b>{room.host}</b> изменил код: <code>{room.code}</code>\n\n"
+        f"Вы получили это уведомление, потому что вы подписаны на обновления этого пользователя"
+    ), key=f"room_{room.owner.user_id}")
 
 
 @dp.message(RoomState.edit_host)
@@ -212,16 +248,7 @@ async def edit_host(message: types.Message, state: FSMContext):
         await message.answer(AnswerEnum.error_host.value, parse_mode=ParseMode.HTML)
         return
 
-    data = await state.get_data()
-    room_id = ObjectId(data['room_id'])
-    await rooms_collection.update_one({'_id': room_id}, {'$set': {'host': message.text}})
-
-    await reschedule_auto_delete(bot, room_id, rooms_collection)
-
-    await state.clear()
-    await message.answer(AnswerEnum.success_edit.value, reply_markup=default_keyboard, parse_mode=ParseMode.HTML)
-
-    logger.info(f"Поле хост комнаты {room_id} было изменено пользователем {message.from_user.id} на {message.text}")
+    await apply_room_edit(message, state, 'host')
 
 
 @dp.message(RoomState.edit_map)
@@ -233,16 +260,7 @@ async def edit_map(message: types.Message, state: FSMContext):
         await message.answer(AnswerEnum.error_edit.value, reply_markup=map_keyboard, parse_mode=ParseMode.HTML)
         return
 
-    data = await state.get_data()
-    room_id = ObjectId(data['room_id'])
-    await rooms_collection.update_one({'_id': room_id}, {'$set': {'map': message.text}})
-
-    await reschedule_auto_delete(bot, room_id, rooms_collection)
-
-    await state.clear()
-    await message.answer(AnswerEnum.success_edit.value, reply_markup=default_keyboard, parse_mode=ParseMode.HTML)
-
-    logger.info(f"Поле карта комнаты {room_id} было изменено пользователем {message.from_user.id} на {message.text}")
+    await apply_room_edit(message, state, 'map')
 
 
 @dp.message(RoomState.edit_game_mode)
@@ -254,16 +272,7 @@ async def edit_game_mode(message: types.Message, state: FSMContext):
         await message.answer(AnswerEnum.error_edit.value, reply_markup=game_mode_keyboard, parse_mode=ParseMode.HTML)
         return
 
-    data = await state.get_data()
-    room_id = ObjectId(data['room_id'])
-    await rooms_collection.update_one({'_id': room_id}, {'$set': {'game_mode': message.text}})
-
-    await reschedule_auto_delete(bot, room_id, rooms_collection)
-
-    await state.clear()
-    await message.answer(AnswerEnum.success_edit.value, reply_markup=default_keyboard, parse_mode=ParseMode.HTML)
-
-    logger.info(f"Поле режим комнаты {room_id} было изменено пользователем {message.from_user.id} на {message.text}")
+    await apply_room_edit(message, state, 'game_mode')
 
 
 @dp.message(RoomState.confirm_delete)
@@ -272,18 +281,21 @@ async def confirm_delete(message: types.Message, state: FSMContext):
         return
 
     if message.text == "Да":
-        user = await get_user(message.from_user.id)
-        rooms = await rooms_collection.find({'owner': user.to_dict()}).to_list(length=None)
+        rooms = await rooms_collection.find({'owner_id': message.from_user.id}, {'_id': 1}).to_list(length=None)
+        room_ids = [room['_id'] for room in rooms]
+
+        # Все комнаты пользователя удаляются одним запросом
+        await rooms_collection.delete_many({'_id': {'$in': room_ids}})
 
-        for room in rooms:
-            room_id = room['_id']
+        for room_id in room_ids:
             cancel_auto_delete(room_id)  # Отмена задачи авто-удаления
-            await rooms_collection.delete_one({'_id': room_id})
+            room_index.remove(room_id)
 
         await message.answer(AnswerEnum.room_delite_plus.value, parse_mode=ParseMode.HTML, reply_markup=types.ReplyKeyboardRemove())
         await message.answer(AnswerEnum.choose_code.value, reply_markup=cancel_keyboard, parse_mode=ParseMode.HTML)
         await state.set_state(RoomState.code)
-        logger.info(f"Комната пользователя {message.from_user.id} была удалена пользователем")
+        logger.info(f"Комнаты пользователя {message.from_user.id} были удалены пользователем: {room_ids}",
+                    extra={'user_id': message.from_user.id})
     else:
         await cancel(message, state)
 
@@ -293,14 +305,15 @@ async def process_delete(message: types.Message, state: FSMContext):
     if await is_press_cancel(message, state):
         return
 
-    user = await get_user(message.from_user.id)
-    room = await rooms_collection.find_one({'owner': user.to_dict(), 'code': message.text})
+    room = await rooms_collection.find_one({'owner_id': message.from_user.id, 'code': message.text})
 
     if room:
         room_id = room['_id']
         cancel_auto_delete(room_id)  # Отмена задачи авто-удаления
         await rooms_collection.delete_one({'_id': room_id})
-        logger.info(f"Комната: {message.text} с индификатором {room_id} была удалена пользователем {message.from_user.id}")
+        room_index.remove(room_id)
+        logger.info(f"Комната: {message.text} с индификатором {room_id} была удалена пользователем {message.from_user.id}",
+                    extra={'room_id': room_id, 'user_id': message.from_user.id})
     else:
         await message.answer(AnswerEnum.invalid_option.value, parse_mode=ParseMode.HTML)
         await state.set_state(RoomState.delete)
@@ -315,23 +328,22 @@ async def process_update_room(message: types.Message, state: FSMContext):
     if await is_press_cancel(message, state):
         return
 
-    user = await get_user(message.from_user.id)
-    room = await rooms_collection.find_one({'owner': user.to_dict(), 'code': message.text})
+    await state.clear()
 
-    if not room:
+    # Продление одной записью, затем перепланирование авто-удаления
+    room, _ = await update_room({'owner_id': message.from_user.id, 'code': message.text})
+    if room is None:
         await message.answer(AnswerEnum.not_found.value, reply_markup=default_keyboard, parse_mode=ParseMode.HTML)
-        await state.clear()
         return
 
-    room_id = room['_id']
-
-    # Перепланирование авто-удаления
-    await reschedule_auto_delete(bot, room_id, rooms_collection)
+    room_id = room.room_id
+    await reschedule_auto_delete(bot, room_id, room.expires_at, rooms_collection)
+    room_index.put(RoomSummary.from_room(room))
 
-    await state.clear()
     await message.answer(f"Время жизни комнаты с кодом <code>{message.text}</code> было обновлено.", parse_mode=ParseMode.HTML, reply_markup=default_keyboard)
 
-    logger.info(f"Время жизни комнаты {message.text} с индификатором {room_id} было обновлено пользователем {message.from_user.id}")
+    logger.info(f"Время жизни комнаты {message.text} с индификатором {room_id} было обновлено пользователем {message.from_user.id}",
+                extra={'room_id': room_id, 'user_id': message.from_user.id})
 
 
 @dp.message(AdminState.add_admin)
@@ -349,7 +361,7 @@ async def process_add_admin(message: types.Message, state: FSMContext):
     if user.is_admin:
         await message.answer("Этот пользователь уже является администратором.", reply_markup=default_keyboard)
     else:
-        await users_collection.update_one(user.to_dict(), {'$set': {"is_admin": True}})
+        await set_user_admin(user.user_id, True)
         await message.answer(f"Пользователь с id <code>{user.user_id}</code> назначен администратором.",
                              parse_mode=ParseMode.HTML,
                              reply_markup=default_keyboard)
@@ -357,8 +369,7 @@ async def process_add_admin(message: types.Message, state: FSMContext):
 
 
 async def remove_admin(user: User):
-    result = await users_collection.update_one(user.to_dict(), {'$set': {"is_admin": False}})
-    return result.matched_count > 0
+    return await set_user_admin(user.user_id, False)
 
 
 @dp.message(AdminState.del_admin)
@@ -395,7 +406,9 @@ async def process_admin_delete_room(message: types.Message, state: FSMContext):
         room_id = room['_id']
         cancel_auto_delete(room_id)  # Отмена задачи авто-удаления
         await rooms_collection.delete_one({'_id': room_id})
-        logger.info(f"Комната: {message.text} с индификатором {room_id} была удалена пользователем {message.from_user.id}")
+        room_index.remove(room_id)
+        logger.info(f"Комната: {message.text} с индификатором {room_id} была удалена пользователем {message.from_user.id}",
+                    extra={'room_id': room_id, 'user_id': message.from_user.id})
     else:
         await message.answer(AnswerEnum.invalid_option.value, parse_mode=ParseMode.HTML)
         await state.set_state(RoomState.delete)
@@ -415,11 +428,10 @@ async def process_broadcast_text(message: types.Message, state: FSMContext):
         await state.set_state(AdminState.broadcast_text)
         return
 
-    # Отправляем всем пользователям, которые зарегистрировались в боте
-    async for chat in chats_collection.find():
-        chat = Chat.from_dict(chat)
-        await send_notification(bot, chat.chat_id, message.text)
+    # Отправляем всем пользователям, которые зарегистрировались в боте, фоновой задачей
+    start_broadcast(bot, message.chat.id, message.text)
+    logger.info(f"Пользователь {message.from_user.id} запустил рассылку", extra={'user_id': message.from_user.id})
 
     await state.clear()
-    await message.reply("Сообщения были успешно отправлены всем пользователям бота", reply_markup=default_keyboard)
+    await message.reply("Рассылка запущена, прогресс будет обновляться в отдельном сообщении", reply_markup=default_keyboard)
 
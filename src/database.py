@@ -0,0 +1,171 @@
+from pymongo import UpdateOne, UpdateMany
+from pymongo.errors import OperationFailure
+
+from src.config import logger, rooms_collection, users_collection, chats_collection, ratings_collection, \
+    subscriptions_collection, fsm_collection
+from src.clock import expires_after
+from src.tasks import LIFE_TIME, EXPIRY_TTL_GRACE
+from src.storage import FSM_STATE_TTL
+
+# Сколько пользователей миграция обрабатывает за одну пачку bulk_write
+MIGRATION_BATCH_SIZE = 500
+
+
+# Уникальный индекс; если в старых данных есть дубликаты, создается обычный, чтобы запросы не сканировали коллекцию
+async def ensure_unique_index(collection, key):
+    try:
+        await collection.create_index(key, unique=True)
+    except OperationFailure as e:
+        logger.error(f"Не удалось создать уникальный индекс {key} в {collection.name}, создаем обычный: {e}")
+        await collection.create_index(key)
+
+
+# TTL индекс; если срок в существующем индексе отличается, он меняется через collMod без пересоздания
+async def ensure_ttl_index(collection, key, expire_after_seconds):
+    index = (await collection.index_information()).get(f'{key}_1')
+    if index is None:
+        await collection.create_index(key, expireAfterSeconds=expire_after_seconds)
+        return
+
+    if index.get('expireAfterSeconds') != expire_after_seconds:
+        await collection.database.command(
+            'collMod', collection.name,
+            index={'keyPattern': {key: 1}, 'expireAfterSeconds': expire_after_seconds}
+        )
+        logger.info(f"Срок TTL индекса {key} в {collection.name} изменен на {expire_after_seconds} с")
+
+
+# Создание индексов, на которые опираются обработчики (операция идемпотентна)
+async def ensure_indexes():
+    # Пользователи и чаты ищутся по своему id в каждом get-or-create
+    await ensure_unique_index(users_collection, 'user_id')
+    await ensure_unique_index(chats_collection, 'chat_id')
+    # Список администраторов: в индекс попадают только они
+    await users_collection.create_index('is_admin', partialFilterExpression={'is_admin': True})
+    # Список комнат /list отсортирован по дате создания
+    await rooms_collection.create_index([('created_at', -1)])
+    # TTL индекс: MongoDB сама удалит комнаты, которые планировщик не успел удалить
+    await ensure_ttl_index(rooms_collection, 'expires_at', EXPIRY_TTL_GRACE)
+    await rooms_collection.create_index([('owner_id', 1), ('code', 1)])
+    # Код комнаты уникален; прежний неуникальный индекс с тем же ключом нужно сначала удалить
+    code_index = (await rooms_collection.index_information()).get('code_1')
+    if code_index is not None and not code_index.get('unique'):
+        await rooms_collection.drop_index('code_1')
+    await ensure_unique_index(rooms_collection, 'code')
+    # Поиск /find: фильтр по карте и режиму с сортировкой по свежести или рейтингу хоста
+    await rooms_collection.create_index([('map', 1), ('game_mode', 1), ('created_at', -1)])
+    await rooms_collection.create_index([('map', 1), ('game_mode', 1), ('owner.likes', -1), ('created_at', -1)])
+    await ratings_collection.create_index([('owner_id', 1), ('user_id', 1)], unique=True)
+    await subscriptions_collection.create_index([('owner_id', 1), ('chat_id', 1)], unique=True)
+    # Незавершенные диалоги FSM удаляются, если к ним не возвращались FSM_STATE_TTL секунд
+    await ensure_ttl_index(fsm_collection, 'updated_at', FSM_STATE_TTL)
+
+
+# Миграция: дедлайн для комнат, созданных до появления поля expires_at.
+# created_at у таких комнат записан в локальном времени сервера, а дедлайны хранятся в UTC,
+# поэтому срок жизни отсчитывается от момента миграции
+async def migrate_rooms_expires_at():
+    result = await rooms_collection.update_many(
+        {'expires_at': {'$exists': False}},
+        {'$set': {'expires_at': expires_after(LIFE_TIME)}}
+    )
+
+    if result.modified_count:
+        logger.info(f"Проставлен expires_at для {result.modified_count} комнат")
+
+
+# Миграция: ключи owner_id и chat_id для комнат, где владелец хранился только вложенным документом
+async def migrate_rooms_owner_keys():
+    result = await rooms_collection.update_many(
+        {'owner_id': {'$exists': False}},
+        [{'$set': {'owner_id': '$owner.user_id', 'chat_id': '$chat.chat_id'}}]
+    )
+
+    if result.modified_count:
+        logger.info(f"Проставлены owner_id и chat_id для {result.modified_count} комнат")
+
+
+# Миграция: коды в верхнем регистре и одна комната на код, иначе уникальный индекс не создастся
+async def migrate_rooms_unique_codes():
+    await rooms_collection.update_many(
+        {'code': {'$regex': '[a-z]'}},
+        [{'$set': {'code': {'$toUpper': '$code'}}}]
+    )
+
+    duplicates = rooms_collection.aggregate([
+        {'$sort': {'created_at': -1}},
+        {'$group': {'_id': '$code', 'room_ids': {'$push': '$_id'}, 'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': 1}}}
+    ])
+    # Остается самая свежая комната с этим кодом
+    stale_ids = [room_id async for group in duplicates for room_id in group['room_ids'][1:]]
+
+    if stale_ids:
+        await rooms_collection.delete_many({'_id': {'$in': stale_ids}})
+        logger.info(f"Удалено {len(stale_ids)} комнат с повторяющимися кодами")
+
+
+# Миграция: перенос вложенных массивов rating и subscribers в отдельные коллекции со счетчиками.
+# Операции копятся и уходят пачками bulk_write по MIGRATION_BATCH_SIZE пользователей
+async def migrate_users_ratings():
+    migrated = 0
+    operations = {collection: [] for collection in (
+        ratings_collection, subscriptions_collection, users_collection, rooms_collection
+    )}
+
+    async def flush():
+        for collection, collection_operations in operations.items():
+            if collection_operations:
+                await collection.bulk_write(collection_operations, ordered=False)
+                collection_operations.clear()
+
+    users_cursor = users_collection.find({'$or': [{'rating': {'$exists': True}}, {'subscribers': {'$exists': True}}]})
+
+    async for user in users_cursor:
+        owner_id = user['user_id']
+        ratings = user.get('rating', [])
+        subscribers = user.get('subscribers', [])
+
+        operations[ratings_collection] += [
+            UpdateOne(
+                {'owner_id': owner_id, 'user_id': rating['user_id']},
+                {'$set': {'rating': rating['rating']}},
+                upsert=True
+            )
+            for rating in ratings
+        ]
+        operations[subscriptions_collection] += [
+            UpdateOne(
+                {'owner_id': owner_id, 'chat_id': subscriber['chat_id']},
+                {'$setOnInsert': {'owner_id': owner_id, 'chat_id': subscriber['chat_id']}},
+                upsert=True
+            )
+            for subscriber in subscribers
+        ]
+
+        counters = {
+            'likes': sum(1 for rating in ratings if rating['rating']),
+            'dislikes': sum(1 for rating in ratings if not rating['rating']),
+            'subscriber_count': len(subscribers)
+        }
+
+        operations[users_collection].append(UpdateOne(
+            {'_id': user['_id']},
+            {'$set': counters, '$unset': {'rating': '', 'subscribers': ''}}
+        ))
+        operations[rooms_collection].append(UpdateMany(
+            {'owner_id': owner_id},
+            {
+                '$set': {f'owner.{name}': value for name, value in counters.items()},
+                '$unset': {'owner.rating': '', 'owner.subscribers': ''}
+            }
+        ))
+        migrated += 1
+
+        if migrated % MIGRATION_BATCH_SIZE == 0:
+            await flush()
+
+    await flush()
+
+    if migrated:
+        logger.info(f"Рейтинги и подписки {migrated} пользователей перенесены в отдельные коллекции")
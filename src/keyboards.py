@@ -1,7 +1,7 @@
 # Клавиатуры
 import logging
 
-from src.models import Map, GameMode, Room, QueryCommand
+from src.models import Map, GameMode, QueryCommand
 from aiogram import types
 
 
@@ -22,14 +22,74 @@ cancel_keyboard = create_keyboard(["Отмена"], include_cancel=False)
 default_keyboard = create_keyboard(["Список рум"], row_width=1, include_cancel=False)
 
 
-def get_subscribe_keyboard(room: Room, is_subscribed):
-    button_text = "Отписаться от хоста" if is_subscribed else "Подписаться на хоста"
+# Строка кнопок комнаты в списке: подписка на хоста и оценки
+def get_room_keyboard_row(code, is_subscribed, page):
+    button_text = f"🔕 {code}" if is_subscribed else f"🔔 {code}"
     query_text = QueryCommand.unsubscribe.value if is_subscribed else QueryCommand.subscribe.value
 
+    return [
+        types.InlineKeyboardButton(text=button_text, callback_data=f"{query_text.lower()}_{code}_{page}"),
+        types.InlineKeyboardButton(text="👍", callback_data=f"{QueryCommand.like.value.lower()}_{code}"),
+        types.InlineKeyboardButton(text="👎", callback_data=f"{QueryCommand.dislike.value.lower()}_{code}")
+    ]
+
+
+def get_rooms_page_keyboard(rows, page, pages_count):
+    inline_keyboard = list(rows)
+
+    # Навигация по страницам
+    if pages_count > 1:
+        page_query = QueryCommand.page.value
+        inline_keyboard.append([
+            types.InlineKeyboardButton(text="◀️", callback_data=f"{page_query}_{(page - 1) % pages_count}"),
+            types.InlineKeyboardButton(text=f"{page + 1}/{pages_count}", callback_data=f"{page_query}_{page}"),
+            types.InlineKeyboardButton(text="▶️", callback_data=f"{page_query}_{(page + 1) % pages_count}")
+        ])
+
+    return types.InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
+
+
+# Значение фильтра поиска в callback_data: индекс элемента перечисления или "x" (любое значение)
+def find_filter_value(options, index):
+    return options[int(index)].value if index.isdigit() and int(index) < len(options) else None
+
+
+def get_find_keyboard(map_index, mode_index, sort, page, has_next):
+    find_query = QueryCommand.find.value
+    maps, modes = list(Map), list(GameMode)
+    map_value = find_filter_value(maps, map_index)
+    mode_value = find_filter_value(modes, mode_index)
+    other_sort = "top" if sort == "new" else "new"
+
+    inline_keyboard = [
+        [types.InlineKeyboardButton(text=f"🚀 {map_value or 'Любая карта'}",
+                                    callback_data=f"{QueryCommand.find_map.value}_{mode_index}_{sort}"),
+         types.InlineKeyboardButton(text=f"🎲 {mode_value or 'Любой режим'}",
+                                    callback_data=f"{QueryCommand.find_mode.value}_{map_index}_{sort}")],
+        [types.InlineKeyboardButton(text="⭐ По рейтингу" if other_sort == "top" else "🕒 Сначала новые",
+                                    callback_data=f"{find_query}_{map_index}_{mode_index}_{other_sort}_0")]
+    ]
+
+    # Навигация по результатам
+    navigation = []
+    if page > 0:
+        navigation.append(types.InlineKeyboardButton(
+            text="◀️", callback_data=f"{find_query}_{map_index}_{mode_index}_{sort}_{page - 1}"))
+    if has_next:
+        navigation.append(types.InlineKeyboardButton(
+            text="▶️", callback_data=f"{find_query}_{map_index}_{mode_index}_{sort}_{page + 1}"))
+    if navigation:
+        inline_keyboard.append(navigation)
+
+    return types.InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
+
+
+# Выбор значения фильтра: каждая кнопка ведет на первую страницу поиска с новым фильтром
+def get_find_choice_keyboard(options, callback_data, row_width=2):
+    buttons = [types.InlineKeyboardButton(text="Любое значение", callback_data=callback_data("x"))]
+    buttons += [types.InlineKeyboardButton(text=option.value, callback_data=callback_data(index))
+                for index, option in enumerate(options)]
+
     return types.InlineKeyboardMarkup(
-        inline_keyboard=[
-            [types.InlineKeyboardButton(text=button_text, callback_data=f"{query_text.lower()}_{room.code}")],
-            [types.InlineKeyboardButton(text="👍", callback_data=f"{QueryCommand.like.value.lower()}_{room.code}"),
-             types.InlineKeyboardButton(text="👎", callback_data=f"{QueryCommand.dislike.value.lower()}_{room.code}")]
-        ]
+        inline_keyboard=[buttons[i:i + row_width] for i in range(0, len(buttons), row_width)]
     )
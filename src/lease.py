@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from src.clock import utc_now
+
+logger = logging.getLogger(__name__)
+
+# Срок аренды и интервал ее продления, в секундах
+LEASE_TTL = 30
+LEASE_RENEW_INTERVAL = 10
+
+
+# Аренда роли ведущего процесса: владелец продлевает документ, после LEASE_TTL без продления его забирает другой
+class Lease:
+    def __init__(self, collection, name: str, holder: str = None, ttl: float = LEASE_TTL,
+                 renew_interval: float = LEASE_RENEW_INTERVAL):
+        self.collection = collection
+        self.name = name
+        self.holder = holder or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.ttl = ttl
+        self.renew_interval = renew_interval
+        self.held = False
+        self._renewed_at = 0.0
+
+    # Аренда считается действующей, пока не истек срок с последнего успешного продления
+    def is_valid(self) -> bool:
+        return self.held and time.monotonic() - self._renewed_at < self.ttl
+
+    async def try_acquire(self) -> bool:
+        now = utc_now()
+        renewed_at = time.monotonic()
+
+        try:
+            lease = await self.collection.find_one_and_update(
+                {'_id': self.name, '$or': [{'holder': self.holder}, {'expires_at': {'$lt': now}}]},
+                {'$set': {
+                    'holder': self.holder,
+                    'expires_at': now + timedelta(seconds=self.ttl),
+                    'heartbeat_at': now
+                }},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Документ аренды существует и принадлежит другому живому процессу
+            self.held = False
+            return False
+
+        self.held = lease is not None and lease['holder'] == self.holder
+        if self.held:
+            self._renewed_at = renewed_at
+
+        return self.held
+
+    async def release(self):
+        if self.held:
+            self.held = False
+            await self.collection.delete_one({'_id': self.name, 'holder': self.holder})
+
+    # Цикл heartbeat: сообщает о получении и потере аренды через колбэки
+    async def keep(self, on_acquired, on_lost):
+        while True:
+            was_held = self.held
+
+            try:
+                await self.try_acquire()
+            except PyMongoError as e:
+                logger.error(f"Не удалось продлить аренду {self.name}: {e}")
+                self.held = self.is_valid()
+
+            if self.held and not was_held:
+                logger.info(f"Процесс {self.holder} получил аренду {self.name}")
+                on_acquired()
+            elif was_held and not self.held:
+                logger.warning(f"Процесс {self.holder} потерял аренду {self.name}")
+                on_lost()
+
+            await asyncio.sleep(self.renew_interval)
@@ -0,0 +1,103 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import time
+from datetime import datetime, timezone
+
+# Поля, которые обработчики передают через extra и которые попадают в JSON отдельными ключами
+STRUCTURED_FIELDS = ('room_id', 'user_id', 'chat_id')
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+# Одна строка JSON на запись: время, уровень, логгер, сообщение и структурные поля
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value if isinstance(value, (int, float)) else str(value)
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+
+        return json.dumps(entry, ensure_ascii=False)
+
+
+# Не больше rate записей в секунду с одного места вызова; предупреждения и ошибки проходят всегда
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate: float, burst: float):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}  # (путь, строка) -> [токены, время обновления, пропущено]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+
+        now = time.monotonic()
+        bucket = self._buckets.setdefault((record.pathname, record.lineno), [self.burst, now, 0])
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+
+        if bucket[0] < 1:
+            bucket[2] += 1
+            return False
+
+        bucket[0] -= 1
+        if bucket[2]:
+            record.msg = f"{record.getMessage()} (пропущено похожих записей: {bucket[2]})"
+            record.args = None
+            bucket[2] = 0
+
+        return True
+
+
+def create_file_handler(path: str, max_bytes: int, backup_count: int, rotate_when: str = None) -> logging.Handler:
+    # Ротация по времени, если она задана, иначе по размеру файла
+    if rotate_when:
+        handler = logging.handlers.TimedRotatingFileHandler(path, when=rotate_when, backupCount=backup_count,
+                                                            encoding='utf-8')
+    else:
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                                       encoding='utf-8')
+
+    handler.setFormatter(JSONFormatter())
+    return handler
+
+
+# Записи уходят в очередь, в консоль и файл их пишет поток QueueListener вне цикла событий
+def setup_logging(path: str, max_bytes: int, backup_count: int, rotate_when: str = None,
+                  sample_rate: float = 5, sample_burst: float = 20, level=logging.INFO) -> logging.handlers.QueueListener:
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    listener = logging.handlers.QueueListener(
+        queue.SimpleQueue(),
+        console_handler,
+        create_file_handler(path, max_bytes, backup_count, rotate_when),
+        respect_handler_level=True
+    )
+
+    queue_handler = logging.handlers.QueueHandler(listener.queue)
+    queue_handler.addFilter(SamplingFilter(sample_rate, sample_burst))
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level)
+
+    listener.start()
+    atexit.register(listener.stop)
+
+    return listener
@@ -0,0 +1,268 @@
+import bisect
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from aiogram.types import TelegramObject
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержек, в секундах
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def escape_label_value(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra: str = '') -> str:
+    pairs = [f'{name}="{escape_label_value(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}  # значения меток -> счетчик
+
+    def inc(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for label_values, value in self.values.items():
+            yield f"{self.name}{format_labels(self.labels, label_values)} {value}"
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}  # значения меток -> [счетчики по корзинам..., сумма, количество]
+
+    def observe(self, value: float, *label_values):
+        series = self.values.get(label_values)
+        if series is None:
+            series = self.values[label_values] = [0] * (len(self.buckets) + 2)
+
+        # Значения больше последней границы попадают только в корзину +Inf (общее количество)
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for label_values, series in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                bucket_labels = format_labels(self.labels, label_values, f'le="{bound}"')
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            bucket_labels = format_labels(self.labels, label_values, 'le="+Inf"')
+            yield f"{self.name}_bucket{bucket_labels} {series[-1]}"
+            yield f"{self.name}_sum{format_labels(self.labels, label_values)} {series[-2]}"
+            yield f"{self.name}_count{format_labels(self.labels, label_values)} {series[-1]}"
+
+
+# Значение снимается функцией в момент запроса /metrics
+class Gauge:
+    def __init__(self, name: str, documentation: str, function: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+
+    def render(self):
+        try:
+            value = self.function()
+        except Exception as e:
+            logger.error(f"Не удалось снять метрику {self.name}: {e}")
+            return
+
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {value}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def gauge(self, name: str, documentation: str, function: Callable[[], float]):
+        return self.register(Gauge(name, documentation, function))
+
+    # Текстовый формат Prometheus
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics.values() for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+handler_latency = registry.register(Histogram(
+    'bot_handler_seconds', 'Время работы обработчика апдейта', ['handler']
+))
+handler_errors = registry.register(Counter(
+    'bot_handler_errors_total', 'Исключения в обработчиках', ['handler']
+))
+mongo_latency = registry.register(Histogram(
+    'bot_mongo_seconds', 'Время операций MongoDB', ['collection', 'operation']
+))
+mongo_errors = registry.register(Counter(
+    'bot_mongo_errors_total', 'Ошибки операций MongoDB', ['collection', 'operation']
+))
+telegram_latency = registry.register(Histogram(
+    'bot_telegram_seconds', 'Время запросов к Bot API', ['method']
+))
+telegram_errors = registry.register(Counter(
+    'bot_telegram_errors_total', 'Ошибки запросов к Bot API', ['method', 'error']
+))
+telegram_retry_after = registry.register(Counter(
+    'bot_telegram_retry_after_total', 'Ответы 429 (RetryAfter) от Bot API', ['method']
+))
+
+
+# Задержка и ошибки каждого обработчика; регистрируется внутренним middleware наблюдателя
+class MetricsMiddleware(BaseMiddleware):
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get('handler')
+        name = handler_object.callback.__name__ if handler_object is not None else type(event).__name__
+        started_at = time.perf_counter()
+
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(name)
+            raise
+        finally:
+            handler_latency.observe(time.perf_counter() - started_at, name)
+
+
+# Число, задержка и ошибки запросов к Bot API по методам; подключается к bot.session
+class BotAPIMetricsMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot, method: TelegramMethod):
+        name = type(method).__name__
+        started_at = time.perf_counter()
+
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            telegram_retry_after.inc(name)
+            raise
+        except Exception as e:
+            telegram_errors.inc(name, type(e).__name__)
+            raise
+        finally:
+            telegram_latency.observe(time.perf_counter() - started_at, name)
+
+
+# Операции Motor, которые возвращают awaitable и замеряются целиком
+TIMED_OPERATIONS = {
+    'find_one', 'find_one_and_update', 'find_one_and_delete', 'find_one_and_replace', 'insert_one', 'insert_many',
+    'update_one', 'update_many', 'replace_one', 'delete_one', 'delete_many', 'bulk_write', 'count_documents',
+    'estimated_document_count', 'distinct', 'create_index', 'drop_index', 'index_information'
+}
+# Операции, которые возвращают курсор: замеряется его чтение
+CURSOR_OPERATIONS = {'find', 'aggregate'}
+
+
+# Курсор, который замеряет полное чтение результатов (to_list или async for)
+class InstrumentedCursor:
+    def __init__(self, cursor, collection: str, operation: str):
+        self._cursor = cursor
+        self._collection = collection
+        self._operation = operation
+
+    def __getattr__(self, name):
+        attribute = getattr(self._cursor, name)
+        if not callable(attribute):
+            return attribute
+
+        # sort/skip/limit возвращают тот же курсор: продолжаем цепочку через обертку
+        def chained(*args, **kwargs):
+            result = attribute(*args, **kwargs)
+            return self if result is self._cursor else result
+
+        return chained
+
+    async def to_list(self, length=None):
+        started_at = time.perf_counter()
+        try:
+            return await self._cursor.to_list(length=length)
+        finally:
+            mongo_latency.observe(time.perf_counter() - started_at, self._collection, self._operation)
+
+    async def __aiter__(self):
+        started_at = time.perf_counter()
+        try:
+            async for document in self._cursor:
+                yield document
+        finally:
+            mongo_latency.observe(time.perf_counter() - started_at, self._collection, self._operation)
+
+
+# Обертка коллекции Motor: время и ошибки каждой операции по имени
+class InstrumentedCollection:
+    def __init__(self, collection, name: str = None):
+        self._collection = collection
+        self._name = name or collection.name
+
+    def __getattr__(self, name):
+        attribute = getattr(self._collection, name)
+
+        if name in TIMED_OPERATIONS:
+            async def timed(*args, **kwargs):
+                started_at = time.perf_counter()
+                try:
+                    return await attribute(*args, **kwargs)
+                except Exception:
+                    mongo_errors.inc(self._name, name)
+                    raise
+                finally:
+                    mongo_latency.observe(time.perf_counter() - started_at, self._name, name)
+
+            return timed
+
+        if name in CURSOR_OPERATIONS:
+            return lambda *args, **kwargs: InstrumentedCursor(attribute(*args, **kwargs), self._name, name)
+
+        return attribute
+
+
+async def handle_metrics(request: web.Request):
+    return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8')
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+
+    return runner
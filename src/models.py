@@ -1,5 +1,5 @@
 from enum import Enum
-from datetime import datetime
+from src.clock import utc_now
 
 
 class Map(Enum):
@@ -50,8 +50,11 @@ class AnswerEnum(Enum):
     info_added_room = "Комната добавлена успешно!"
     not_found = "Увы... Нет подходящей комнаты 😢"
     not_found_rooms = "Упс...\n\nНет опубликованных комнат 😢"
+    good_game = "Приятной игры!"
     success_edit = "Изменения приняты!"
     error_edit = "Изменения не приняты, попробуйте что-то исправить 😢"
+    nothing_changed = "Новое значение совпадает с текущим, изменений нет."
+    code_taken = "Комната с таким кодом уже опубликована. Проверьте код и введите его снова:"
     room_delite = "Комната удалена."
     room_delite_plus = "Комната удалена.\n\nТеперь вы можете добавить новую."
     invalid_option = "Пожалуйста, выберите один из предложенных вариантов или нажмите 'Отмена'."
@@ -63,9 +66,15 @@ class QueryCommand(Enum):
     unsubscribe = "отписаться"
     like = "like"
     dislike = "dislike"
+    page = "page"
+    find = "find"
+    find_map = "findmap"
+    find_mode = "findmode"
 
 
 class Chat:
+    __slots__ = ('chat_id',)
+
     def __init__(self, chat_id: int):
         self.chat_id = chat_id
 
@@ -85,14 +94,18 @@ class Chat:
 
 
 class Rating:
-    def __init__(self, rating: bool, user_id: int):
+    __slots__ = ('rating', 'user_id', 'owner_id')
+
+    def __init__(self, rating: bool, user_id: int, owner_id: int = None):
         self.rating = rating
         self.user_id = user_id
+        self.owner_id = owner_id
 
     def to_dict(self):
         return {
-            'rating': self.rating,
-            'user_id': self.user_id
+            'owner_id': self.owner_id,
+            'user_id': self.user_id,
+            'rating': self.rating
         }
 
     @classmethod
@@ -102,23 +115,53 @@ class Rating:
 
         return cls(
             rating=data['rating'],
-            user_id=data['user_id']
+            user_id=data['user_id'],
+            owner_id=data.get('owner_id')
+        )
+
+
+class Subscription:
+    __slots__ = ('owner_id', 'chat_id')
+
+    def __init__(self, owner_id: int, chat_id: int):
+        self.owner_id = owner_id
+        self.chat_id = chat_id
+
+    def to_dict(self):
+        return {
+            'owner_id': self.owner_id,
+            'chat_id': self.chat_id
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data is None:
+            raise ValueError("Cannot create Subscription from None")
+
+        return cls(
+            owner_id=data['owner_id'],
+            chat_id=data['chat_id']
         )
 
 
 class User:
-    def __init__(self, user_id: int, is_admin: bool = False, subscribers=None, rating=None):
+    __slots__ = ('user_id', 'is_admin', 'likes', 'dislikes', 'subscriber_count')
+
+    def __init__(self, user_id: int, is_admin: bool = False, likes: int = 0, dislikes: int = 0,
+                 subscriber_count: int = 0):
         self.user_id = user_id
         self.is_admin = is_admin
-        self.subscribers = subscribers or []
-        self.rating = rating or []
+        self.likes = likes
+        self.dislikes = dislikes
+        self.subscriber_count = subscriber_count
 
     def to_dict(self):
         return {
             'user_id': self.user_id,
             'is_admin': self.is_admin,
-            'subscribers': [subscriber.to_dict() for subscriber in self.subscribers],
-            'rating': [rating_item.to_dict() for rating_item in self.rating],
+            'likes': self.likes,
+            'dislikes': self.dislikes,
+            'subscriber_count': self.subscriber_count,
         }
 
     @classmethod
@@ -126,25 +169,31 @@ class User:
         if data is None:
             raise ValueError("Cannot create User from None")
 
-        subscribers = [Chat.from_dict(subscriber) for subscriber in data.get('subscribers', [])]
-        rating = [Rating.from_dict(rating_item) for rating_item in data.get('rating', [])]
         return cls(
             user_id=data['user_id'],
-            is_admin=data['is_admin'],
-            subscribers=subscribers,
-            rating=rating
+            is_admin=data.get('is_admin', False),
+            likes=data.get('likes', 0),
+            dislikes=data.get('dislikes', 0),
+            subscriber_count=data.get('subscriber_count', 0)
         )
 
 
 class Room:
-    def __init__(self, code: str, host: str, map: Map, game_mode: GameMode, owner: User, chat: Chat, created_at=None):
+    __slots__ = ('code', 'host', 'map', 'game_mode', 'owner', 'chat', 'created_at', 'expires_at', 'room_id', 'version')
+
+    def __init__(self, code: str, host: str, map: Map, game_mode: GameMode, owner: User, chat: Chat, created_at=None,
+                 expires_at=None, room_id=None, version: int = 0):
         self.code = code.upper().strip()
         self.host = host.strip()
         self.map = map
         self.game_mode = game_mode
         self.owner = owner
         self.chat = chat
-        self.created_at = created_at or datetime.now()
+        self.created_at = created_at or utc_now()
+        self.expires_at = expires_at
+        self.room_id = room_id
+        # Растет при каждом изменении, которое видно в карточке комнаты
+        self.version = version
 
     def to_dict(self):
         return {
@@ -153,8 +202,12 @@ class Room:
             'map': self.map.value,
             'game_mode': self.game_mode.value,
             'owner': self.owner.to_dict(),
+            'owner_id': self.owner.user_id,
             'chat': self.chat.to_dict(),
-            'created_at': self.created_at
+            'chat_id': self.chat.chat_id,
+            'created_at': self.created_at,
+            'expires_at': self.expires_at,
+            'version': self.version
         }
 
     @classmethod
@@ -169,5 +222,72 @@ class Room:
             game_mode=GameMode(data['game_mode']),
             owner=User.from_dict(data['owner']),
             chat=Chat.from_dict(data['chat']),
-            created_at=data['created_at']
+            created_at=data.get('created_at'),
+            expires_at=data.get('expires_at'),
+            room_id=data.get('_id'),
+            version=data.get('version', 0)
+        )
+
+
+# Поля документа комнаты, из которых собирается RoomSummary
+ROOM_SUMMARY_PROJECTION = {
+    'code': 1, 'host': 1, 'map': 1, 'game_mode': 1, 'created_at': 1, 'expires_at': 1, 'version': 1,
+    'owner_id': 1, 'owner.likes': 1, 'owner.dislikes': 1
+}
+
+
+# Облегченная комната для списков и поиска: только поля карточки
+class RoomSummary:
+    __slots__ = ('room_id', 'code', 'host', 'map', 'game_mode', 'owner_id', 'likes', 'dislikes', 'created_at',
+                 'expires_at', 'version')
+
+    def __init__(self, room_id, code: str, host: str, map: Map, game_mode: GameMode, owner_id: int, likes: int = 0,
+                 dislikes: int = 0, created_at=None, expires_at=None, version: int = 0):
+        self.room_id = room_id
+        self.code = code
+        self.host = host
+        self.map = map
+        self.game_mode = game_mode
+        self.owner_id = owner_id
+        self.likes = likes
+        self.dislikes = dislikes
+        self.created_at = created_at
+        self.expires_at = expires_at
+        self.version = version
+
+    @classmethod
+    def from_room(cls, room: Room):
+        return cls(
+            room_id=room.room_id,
+            code=room.code,
+            host=room.host,
+            map=room.map,
+            game_mode=room.game_mode,
+            owner_id=room.owner.user_id,
+            likes=room.owner.likes,
+            dislikes=room.owner.dislikes,
+            created_at=room.created_at,
+            expires_at=room.expires_at,
+            version=room.version
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        if data is None:
+            raise ValueError("Cannot create RoomSummary from None")
+
+        owner = data.get('owner', {})
+
+        return cls(
+            room_id=data.get('_id'),
+            code=data['code'],
+            host=data['host'],
+            map=Map(data['map']),
+            game_mode=GameMode(data['game_mode']),
+            owner_id=data['owner_id'],
+            likes=owner.get('likes', 0),
+            dislikes=owner.get('dislikes', 0),
+            created_at=data.get('created_at'),
+            expires_at=data.get('expires_at'),
+            version=data.get('version', 0)
         )
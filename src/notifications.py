@@ -1,12 +1,99 @@
+import asyncio
+import itertools
 import logging
 from aiogram import Bot
 from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+
+from src.ratelimit import global_limiter, chat_limiter
 
 logger = logging.getLogger(__name__)
 
+# Сколько раз повторять отправку после RetryAfter
+MAX_RETRIES = 3
+# Количество воркеров и размер очереди уведомлений
+NOTIFICATION_WORKERS = 10
+NOTIFICATION_QUEUE_SIZE = 10_000
+
 
 async def send_notification(bot: Bot, chat_id: int, message: str, parse_mode: ParseMode = ParseMode.HTML):
     try:
         await bot.send_message(chat_id=chat_id, text=message, parse_mode=parse_mode)
     except Exception as e:
-        logger.error(f"Не удалось отправить сообщение пользователю {chat_id}: {e}")
\ No newline at end of file
+        logger.error(f"Не удалось отправить сообщение пользователю {chat_id}: {e}")
+
+
+# Чат больше недоступен: бот заблокирован, исключен из группы или чат удален
+def is_dead_chat_error(error: Exception):
+    if isinstance(error, TelegramForbiddenError):
+        return True
+
+    return isinstance(error, TelegramBadRequest) and "chat not found" in str(error).lower()
+
+
+# Отправка одного сообщения с учетом лимитов Telegram, прочие ошибки API пробрасываются вызывающему
+async def send_limited(bot: Bot, chat_id: int, text: str, parse_mode: ParseMode = ParseMode.HTML):
+    for _ in range(MAX_RETRIES):
+        await chat_limiter.acquire(chat_id)
+        await global_limiter.acquire()
+
+        try:
+            await bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
+            return
+        except TelegramRetryAfter as e:
+            logger.warning(f"Превышен лимит Telegram, пауза {e.retry_after} секунд")
+            global_limiter.pause(e.retry_after)
+
+    raise RuntimeError(f"Не удалось отправить сообщение в чат {chat_id} после {MAX_RETRIES} попыток")
+
+
+# Очередь уведомлений с пулом воркеров: ожидающие задания с одним ключом склеиваются в последнее
+class NotificationDispatcher:
+    def __init__(self, workers: int = NOTIFICATION_WORKERS, maxsize: int = NOTIFICATION_QUEUE_SIZE):
+        self.workers_count = workers
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.pending = {}  # job_key -> (chat_id, text)
+        self.coalesced = 0
+        self._unique_keys = itertools.count()
+        self._workers = []
+        self.bot = None
+
+    def start(self, bot: Bot):
+        self.bot = bot
+        self._workers = [worker for worker in self._workers if not worker.done()]
+
+        while len(self._workers) < self.workers_count:
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    async def enqueue(self, bot: Bot, chat_id: int, text: str, key=None):
+        self.start(bot)
+
+        job_key = (chat_id, key) if key is not None else (chat_id, next(self._unique_keys), None)
+        if job_key in self.pending:
+            self.pending[job_key] = (chat_id, text)
+            self.coalesced += 1
+            return
+
+        self.pending[job_key] = (chat_id, text)
+        await self.queue.put(job_key)
+
+    async def _worker(self):
+        while True:
+            job_key = await self.queue.get()
+            chat_id, text = self.pending.pop(job_key)
+
+            try:
+                await send_limited(self.bot, chat_id, text)
+            except Exception as e:
+                logger.error(f"Не удалось отправить сообщение пользователю {chat_id}: {e}")
+            finally:
+                self.queue.task_done()
+
+
+notification_dispatcher = NotificationDispatcher()
+
+
+# Постановка уведомлений в очередь для всех подписчиков хоста
+async def notify_subscribers(bot: Bot, subscribers, text: str, key=None):
+    async for chat in subscribers:
+        await notification_dispatcher.enqueue(bot, chat.chat_id, text, key)
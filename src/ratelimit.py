@@ -0,0 +1,98 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+# Лимиты Telegram: около 30 сообщений в секунду на бота и около одного в секунду в один чат
+TELEGRAM_GLOBAL_RATE = 25
+TELEGRAM_CHAT_INTERVAL = 1.0
+
+
+# Ведро токенов: rate токенов в секунду, не более capacity накопленных
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    # Неблокирующая попытка взять токен
+    def try_acquire(self) -> bool:
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return False
+
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+
+        return False
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    # Пауза для всех отправок, например после ответа RetryAfter от Telegram
+    def pause(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+# Не чаще одного действия в interval секунд для каждого ключа (например, chat_id)
+class KeyedRateLimiter:
+    def __init__(self, interval: float, max_keys: int = 100_000):
+        self.interval = interval
+        self.max_keys = max_keys
+        self._next_allowed = OrderedDict()
+
+    async def acquire(self, key):
+        now = time.monotonic()
+        allowed_at = max(now, self._next_allowed.pop(key, 0.0))
+        self._next_allowed[key] = allowed_at + self.interval
+
+        # Ключи, к которым давно не обращались, вытесняются первыми
+        while len(self._next_allowed) > self.max_keys:
+            self._next_allowed.popitem(last=False)
+
+        if allowed_at > now:
+            await asyncio.sleep(allowed_at - now)
+
+
+# Отдельное ведро токенов на каждый ключ; давно не использованные ключи вытесняются
+class KeyedTokenBuckets:
+    def __init__(self, rate: float, capacity: float = None, max_keys: int = 100_000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    def try_acquire(self, key) -> bool:
+        bucket = self._buckets.pop(key, None) or TokenBucket(self.rate, self.capacity)
+        self._buckets[key] = bucket
+
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+        return bucket.try_acquire()
+
+
+# Общие лимитеры отправки сообщений для всех фоновых рассылок бота
+global_limiter = TokenBucket(TELEGRAM_GLOBAL_RATE)
+chat_limiter = KeyedRateLimiter(TELEGRAM_CHAT_INTERVAL)
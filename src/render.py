@@ -0,0 +1,54 @@
+from src.cache import room_cards_cache
+from src.keyboards import get_room_keyboard_row
+from src.models import RoomSummary
+
+
+def format_room_card(room: RoomSummary) -> str:
+    return (
+        f"<i>Рейтинг: 👍 {room.likes} / 👎 {room.dislikes}</i>\n"
+        f"                         ╭    🚀  {room.map.value}\n"
+        f"<code>{room.code}</code>       --¦     👑  <b>{room.host}</b>\n"
+        f"                         ╰    🎲  {room.game_mode.value}"
+    )
+
+
+# Отрисованная карточка комнаты и строки ее клавиатуры, общие для всех зрителей
+class RenderedRoom:
+    def __init__(self, room: RoomSummary):
+        self.code = room.code
+        self.owner_id = room.owner_id
+        self.card = format_room_card(room)
+        self._rows = {}  # (is_subscribed, page) -> [кнопки]
+
+    # От зрителя зависит только кнопка подписки, обе ее версии собираются один раз
+    def keyboard_row(self, is_subscribed: bool, page: int):
+        row = self._rows.get((is_subscribed, page))
+        if row is None:
+            row = self._rows[(is_subscribed, page)] = get_room_keyboard_row(self.code, is_subscribed, page)
+
+        return row
+
+
+# Карточка по ключу (room_id, version): изменение комнаты или рейтинга хоста повышает версию,
+# поэтому устаревшая запись больше не запрашивается и вытесняется из кэша
+def render_room(room: RoomSummary) -> RenderedRoom:
+    key = (room.room_id, room.version)
+    rendered = room_cards_cache.get(key)
+
+    if rendered is None:
+        rendered = RenderedRoom(room)
+        room_cards_cache.set(key, rendered)
+
+    return rendered
+
+
+# То же для документа из базы: при попадании в кэш модель комнаты не собирается
+def render_room_data(room_data: dict) -> RenderedRoom:
+    key = (room_data['_id'], room_data.get('version', 0))
+    rendered = room_cards_cache.get(key)
+
+    if rendered is None:
+        rendered = RenderedRoom(RoomSummary.from_dict(room_data))
+        room_cards_cache.set(key, rendered)
+
+    return rendered
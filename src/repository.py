@@ -0,0 +1,39 @@
+from pymongo import ReturnDocument
+
+from src.clock import expires_after
+from src.config import rooms_collection
+from src.models import Room
+from src.tasks import LIFE_TIME
+
+
+# Приведение полей к тому виду, в котором их хранит конструктор Room
+def normalize_room_fields(fields: dict) -> dict:
+    normalized = dict(fields)
+
+    if 'code' in normalized:
+        normalized['code'] = normalized['code'].upper().strip()
+    if 'host' in normalized:
+        normalized['host'] = normalized['host'].strip()
+
+    return normalized
+
+
+# Изменение комнаты с продлением expires_at одним запросом; возвращает (room, changed)
+async def update_room(query: dict, fields: dict = None):
+    fields = normalize_room_fields(fields or {})
+    query = dict(query)
+    update = {'$set': {**fields, 'expires_at': expires_after(LIFE_TIME)}}
+
+    if fields:
+        # Документ подходит под фильтр, только если хотя бы одно поле действительно меняется
+        query['$or'] = [{name: {'$ne': value}} for name, value in fields.items()]
+        update['$inc'] = {'version': 1}
+
+    room_data = await rooms_collection.find_one_and_update(query, update, return_document=ReturnDocument.AFTER)
+    if room_data is not None:
+        return Room.from_dict(room_data), True
+
+    # Не изменилось ничего или комнату уже удалили: различаем только в этом редком случае
+    query.pop('$or', None)
+    room_data = await rooms_collection.find_one(query)
+    return (Room.from_dict(room_data) if room_data is not None else None), False
@@ -0,0 +1,103 @@
+import logging
+from datetime import datetime
+
+from src.change_stream import watch_collection
+from src.clock import utc_now
+from src.config import rooms_collection
+from src.models import RoomSummary, ROOM_SUMMARY_PROJECTION
+from src.tasks import deleted_room_listeners
+
+logger = logging.getLogger(__name__)
+
+
+# Живые комнаты в памяти для inline-поиска без обращений к базе
+class RoomIndex:
+    def __init__(self):
+        self.rooms = {}  # room_id -> RoomSummary
+        self.search_texts = {}  # room_id -> строка для поиска в нижнем регистре
+        self._ordered = None  # room_id по убыванию даты создания, пересчитывается после изменений
+
+    def __len__(self):
+        return len(self.rooms)
+
+    def put(self, room: RoomSummary):
+        self.rooms[room.room_id] = room
+        self.search_texts[room.room_id] = " ".join(
+            (room.code, room.host, room.map.value, room.game_mode.value)
+        ).lower()
+        self._ordered = None
+
+    def remove(self, room_id):
+        if self.rooms.pop(room_id, None) is not None:
+            del self.search_texts[room_id]
+            self._ordered = None
+
+    # Обновление рейтинга хоста во всех его комнатах
+    def update_owner(self, owner_id: int, counters: dict):
+        for room in self.rooms.values():
+            if room.owner_id == owner_id:
+                room.version += 1
+                room.likes += counters.get('likes', 0)
+                room.dislikes += counters.get('dislikes', 0)
+
+    async def refresh(self, room_id):
+        room_data = await rooms_collection.find_one({'_id': room_id}, ROOM_SUMMARY_PROJECTION)
+
+        if room_data is None:
+            self.remove(room_id)
+        else:
+            self.put(RoomSummary.from_dict(room_data))
+
+    async def load(self):
+        self.rooms, self.search_texts, self._ordered = {}, {}, None
+
+        async for room_data in rooms_collection.find({'expires_at': {'$gt': utc_now()}}, ROOM_SUMMARY_PROJECTION):
+            self.put(RoomSummary.from_dict(room_data))
+
+        logger.info(f"Загружено комнат в индекс поиска: {len(self.rooms)}")
+
+    def _order(self):
+        if self._ordered is None:
+            self._ordered = sorted(
+                self.rooms, key=lambda room_id: self.rooms[room_id].created_at or datetime.min, reverse=True
+            )
+
+        return self._ordered
+
+    # Поиск по коду, хосту, карте и режиму: каждое слово запроса должно встретиться в карточке
+    def search(self, query: str, offset: int = 0, limit: int = 20):
+        # Истекшие комнаты убираем здесь же: планировщик удаляет их из базы к тому же дедлайну.
+        # Комнаты без expires_at (до миграции или из change stream без поля) остаются
+        now = utc_now()
+        expired = [
+            room_id for room_id, room in self.rooms.items()
+            if room.expires_at is not None and room.expires_at <= now
+        ]
+        for room_id in expired:
+            self.remove(room_id)
+
+        terms = query.lower().split()
+        found = [
+            self.rooms[room_id] for room_id in self._order()
+            if all(term in self.search_texts[room_id] for term in terms)
+        ]
+
+        return found[offset:offset + limit], len(found) > offset + limit
+
+    def apply_change(self, change):
+        room_data = change.get('fullDocument')
+
+        # У drop и invalidate нет documentKey: такие события относятся к коллекции, а не к комнате
+        if change['operationType'] != 'delete' and room_data is not None:
+            self.put(RoomSummary.from_dict(room_data))
+        elif 'documentKey' in change:
+            self.remove(change['documentKey']['_id'])
+
+    # Комнаты, добавленные, измененные и удаленные в других процессах (нужен replica set)
+    async def watch(self):
+        await watch_collection(rooms_collection, "индекса комнат", self.apply_change, self.load)
+
+
+room_index = RoomIndex()
+# Комнаты, удаленные планировщиком, сразу пропадают из поиска
+deleted_room_listeners.append(room_index.remove)
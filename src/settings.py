@@ -0,0 +1,132 @@
+import typing
+from typing import Optional
+
+from dotenv import dotenv_values
+
+ENV_PATH = ".env"
+TRUE_VALUES = {'1', 'true', 'yes', 'on'}
+FALSE_VALUES = {'0', 'false', 'no', 'off'}
+
+
+# Настройки из .env, приведенные к типам аннотаций; поля без значения по умолчанию обязательны
+class Settings:
+    # Telegram
+    api_token: str
+    admin_id: str
+    # Адрес Bot API можно переопределить, например на локальный сервер Bot API или тестовую заглушку
+    telegram_api_url: Optional[str] = None
+
+    # MongoDB и пул соединений Motor
+    mongo_client: str
+    mongo_db: str = "ggd"
+    mongo_max_pool_size: int = 100
+    mongo_min_pool_size: int = 0
+    # 0 - без ограничения
+    mongo_max_idle_time_ms: int = 0
+    mongo_connect_timeout_ms: int = 20_000
+    mongo_server_selection_timeout_ms: int = 30_000
+    mongo_socket_timeout_ms: int = 0
+
+    # Хранилище состояний: mongo (общее для нескольких процессов) или memory
+    fsm_storage: str = "mongo"
+
+    # Способ получения апдейтов: polling или webhook
+    updates_mode: str = "polling"
+    webhook_url: Optional[str] = None
+    webhook_secret: str = ""
+    webhook_host: str = "0.0.0.0"
+    webhook_port: int = 8080
+    webhook_path: str = "/webhook"
+    update_workers: int = 8
+    update_queue_size: int = 1000
+
+    # Локальный эндпоинт /metrics; 0 отключает его
+    metrics_host: str = "127.0.0.1"
+    metrics_port: int = 9108
+
+    # Логи: файл JSON с ротацией по размеру или по времени (например midnight)
+    log_file: str = "bot.log"
+    log_max_bytes: int = 10 * 1024 * 1024
+    log_backup_count: int = 5
+    log_rotate_when: Optional[str] = None
+    # Не больше LOG_SAMPLE_RATE записей в секунду с одного места вызова
+    log_sample_rate: float = 5
+
+    # Прогрев кэшей карточек комнат и пользователей при запуске
+    warm_caches: bool = True
+
+    @classmethod
+    def from_dict(cls, values: dict) -> 'Settings':
+        settings = cls()
+        errors = []
+
+        for name, annotation in typing.get_type_hints(cls).items():
+            raw = values.get(name.upper())
+
+            if raw is None or raw.strip() == "":
+                if not hasattr(cls, name):
+                    errors.append(f"{name.upper()} не задан")
+                continue
+
+            try:
+                setattr(settings, name, parse_value(raw.strip(), annotation))
+            except ValueError:
+                errors.append(f"{name.upper()}={raw!r}: ожидается {type_name(annotation)}")
+
+        errors += settings.validate()
+        if errors:
+            raise ValueError("Ошибки в настройках .env:\n" + "\n".join(errors))
+
+        return settings
+
+    def validate(self):
+        errors = []
+
+        if self.updates_mode not in ("polling", "webhook"):
+            errors.append(f"UPDATES_MODE={self.updates_mode!r}: ожидается polling или webhook")
+        if self.updates_mode == "webhook" and not (self.webhook_url and self.webhook_secret):
+            errors.append("Для режима webhook нужно указать WEBHOOK_URL и WEBHOOK_SECRET")
+        if self.fsm_storage not in ("mongo", "memory"):
+            errors.append(f"FSM_STORAGE={self.fsm_storage!r}: ожидается mongo или memory")
+        if self.mongo_max_pool_size < max(self.mongo_min_pool_size, 1):
+            errors.append("MONGO_MAX_POOL_SIZE должен быть не меньше 1 и не меньше MONGO_MIN_POOL_SIZE")
+        if self.update_workers < 1 or self.update_queue_size < 1:
+            errors.append("UPDATE_WORKERS и UPDATE_QUEUE_SIZE должны быть положительными")
+
+        return errors
+
+    # Параметры AsyncIOMotorClient; нулевые ограничения означают их отсутствие
+    def mongo_options(self) -> dict:
+        return {
+            'maxPoolSize': self.mongo_max_pool_size,
+            'minPoolSize': self.mongo_min_pool_size,
+            'maxIdleTimeMS': self.mongo_max_idle_time_ms or None,
+            'connectTimeoutMS': self.mongo_connect_timeout_ms,
+            'serverSelectionTimeoutMS': self.mongo_server_selection_timeout_ms,
+            'socketTimeoutMS': self.mongo_socket_timeout_ms or None
+        }
+
+
+def type_name(annotation) -> str:
+    kind = next((arg for arg in typing.get_args(annotation) if arg is not type(None)), annotation)
+    return {int: "целое число", float: "число", bool: "true или false"}.get(kind, "строка")
+
+
+def parse_value(raw: str, annotation):
+    # Optional[X] разбирается как X
+    kind = next((arg for arg in typing.get_args(annotation) if arg is not type(None)), annotation)
+
+    if kind is bool:
+        if raw.lower() in TRUE_VALUES:
+            return True
+        if raw.lower() in FALSE_VALUES:
+            return False
+        raise ValueError(raw)
+    if kind in (int, float):
+        return kind(raw)
+
+    return raw
+
+
+def load_settings(path: str = ENV_PATH) -> Settings:
+    return Settings.from_dict(dotenv_values(path))
@@ -0,0 +1,107 @@
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+from aiogram.types import TelegramObject
+from pymongo import UpdateOne, DeleteOne
+
+from src.cache import TTLCache
+
+# Время жизни незавершенного диалога в базе, в секундах
+FSM_STATE_TTL = 60 * 60 * 24
+# Страховочное время жизни локального кэша: обычно запись вытесняется сразу после обработки апдейта
+FSM_CACHE_TTL = 60
+
+
+# FSM хранилище в MongoDB: изменения копятся за апдейт и пишутся одной операцией на ключ
+class MongoStorage(BaseStorage):
+    def __init__(self, collection, cache_ttl: float = FSM_CACHE_TTL):
+        self.collection = collection
+        self._cache = TTLCache('fsm', ttl=cache_ttl)  # key_id -> {'state': ..., 'data': ...}
+        self._pending = {}  # key_id -> {'state': ..., 'data': ...}
+
+    @staticmethod
+    def key_id(key: StorageKey) -> str:
+        return ":".join(str(part) for part in (
+            key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny
+        ))
+
+    async def _get_field(self, key: StorageKey, field: str):
+        key_id = self.key_id(key)
+
+        pending = self._pending.get(key_id, {})
+        if field in pending:
+            return pending[field]
+
+        record = self._cache.get(key_id)
+        if record is None:
+            document = await self.collection.find_one({'_id': key_id}, {'state': 1, 'data': 1}) or {}
+            record = {'state': document.get('state'), 'data': document.get('data', {})}
+            self._cache.set(key_id, record)
+
+        return record[field]
+
+    def _set_field(self, key: StorageKey, field: str, value):
+        self._pending.setdefault(self.key_id(key), {})[field] = value
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        self._set_field(key, 'state', state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self._get_field(key, 'state')
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        self._set_field(key, 'data', data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._get_field(key, 'data')).copy()
+
+    def _write_operation(self, key_id: str, fields: dict):
+        # Диалог завершен: state.clear() сбросил и состояние, и данные
+        if fields.get('state', 0) is None and fields.get('data') == {}:
+            return DeleteOne({'_id': key_id})
+
+        return UpdateOne({'_id': key_id}, {'$set': fields, '$currentDate': {'updated_at': True}}, upsert=True)
+
+    # Запись накопленных изменений одного ключа и сброс его локального кэша
+    async def flush(self, key: StorageKey):
+        key_id = self.key_id(key)
+        fields = self._pending.pop(key_id, None)
+        self._cache.invalidate(key_id)
+
+        if fields:
+            await self.collection.bulk_write([self._write_operation(key_id, fields)])
+
+    # Запись всех накопленных изменений одной пачкой
+    async def flush_all(self):
+        pending, self._pending = self._pending, {}
+        self._cache.clear()
+
+        if pending:
+            await self.collection.bulk_write(
+                [self._write_operation(key_id, fields) for key_id, fields in pending.items()],
+                ordered=False
+            )
+
+    async def close(self) -> None:
+        await self.flush_all()
+
+
+# Сбрасывает изменения FSM в MongoStorage после обработки каждого апдейта
+class FSMFlushMiddleware(BaseMiddleware):
+    def __init__(self, storage: MongoStorage):
+        self.storage = storage
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        try:
+            return await handler(event, data)
+        finally:
+            state = data.get('state')
+            if state is not None:
+                await self.storage.flush(state.key)
@@ -1,99 +1,319 @@
 import asyncio
+import heapq
+import itertools
 import logging
 from aiogram import Bot
-from datetime import datetime
-from src.notifications import send_notification
+from pymongo.errors import PyMongoError
+from src.notifications import notification_dispatcher
 from src.models import Room
+from src.clock import now_timestamp, to_timestamp, from_timestamp
+from src.lease import Lease, LEASE_RENEW_INTERVAL
 
 logger = logging.getLogger(__name__)
 
 LIFE_TIME = 60 * 60 * 2
 NOTIFY_TIME = 60 * 5
+# Горизонт, на который планировщик подгружает дедлайны из базы
+EXPIRY_HORIZON = 60 * 30
+# Запас времени, после которого просроченные комнаты удаляет сама MongoDB (TTL индекс)
+EXPIRY_TTL_GRACE = 60 * 10
 
-# Для хранения задач на авто-удаление
-auto_delete_tasks = {}
+# Допуск на расхождение часов при сверке дедлайна с базой, в секундах
+CLOCK_SLACK = 1
+# Имя аренды, владелец которой выполняет удаления
+EXPIRY_LEASE = 'expiry_worker'
 
+# Виды событий в очереди планировщика
+WARNING_EVENT = 0
+DELETE_EVENT = 1
 
-# Функция для автоматического удаления комнаты
-async def auto_delete_room(bot: Bot, room_id, rooms_collection):
-    room_data = await rooms_collection.find_one({'_id': room_id})
+# Обработчики удаления комнаты планировщиком, получают room_id: так, например, индекс поиска
+# узнает об удалении без change stream
+deleted_room_listeners = []
 
-    if room_data:
-        room = Room.from_dict(room_data)
 
-        await rooms_collection.delete_one({'_id': room_id})
-        auto_delete_tasks.pop(room_id, None)
+# Планировщик авто-удаления: куча дедлайнов с ленивой отменой в одной фоновой задаче; удаляет только владелец аренды
+class ExpiryScheduler:
+    def __init__(self, use_lease: bool = True):
+        self.deadlines = {}  # room_id -> (token, deadline)
+        self._heap = []  # (fire_at, token, room_id, event)
+        self._tokens = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._lease_task = None
+        self.use_lease = use_lease
+        self.lease = None
+        self.loaded_until = 0.0
+        self.bot = None
+        self.rooms_collection = None
 
-        logger.info(f"Комната {room_id} была удалена автоматически")
+    def __len__(self):
+        return len(self.deadlines)
 
-        await send_notification(
+    def __contains__(self, room_id):
+        return room_id in self.deadlines
+
+    @property
+    def is_leader(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self, bot: Bot, rooms_collection):
+        self.bot = bot
+        self.rooms_collection = rooms_collection
+
+        if not self.use_lease:
+            if not self.is_leader:
+                self._on_lease_acquired()
+        elif self._lease_task is None or self._lease_task.done():
+            self.lease = Lease(rooms_collection.database['leases'], EXPIRY_LEASE)
+            self._lease_task = asyncio.create_task(self.lease.keep(self._on_lease_acquired, self._on_lease_lost))
+
+    # Ведущий процесс начинает с чистого состояния и подгружает дедлайны из базы
+    def _on_lease_acquired(self):
+        self._reset()
+        self._task = asyncio.create_task(self._run())
+
+    def _on_lease_lost(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._reset()
+
+    # Остановка при завершении процесса: аренда освобождается, чтобы следующий процесс не ждал LEASE_TTL
+    async def stop(self):
+        tasks = [task for task in (self._lease_task, self._task) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._lease_task = self._task = None
+        self._reset()
+
+        if self.lease is not None:
+            try:
+                await self.lease.release()
+            except PyMongoError as e:
+                logger.error(f"Не удалось освободить аренду {EXPIRY_LEASE}: {e}")
+
+    def _reset(self):
+        self.deadlines.clear()
+        self._heap.clear()
+        self.loaded_until = 0.0
+
+    def schedule(self, room_id, deadline):
+        # Не ведущий процесс: дедлайн уже записан в документ комнаты, его подхватит владелец аренды
+        if not self.is_leader:
+            return
+
+        token = next(self._tokens)
+        self.deadlines[room_id] = (token, deadline)
+
+        if deadline - now_timestamp() > NOTIFY_TIME:
+            self._push(deadline - NOTIFY_TIME, token, room_id, WARNING_EVENT)
+        self._push(deadline, token, room_id, DELETE_EVENT)
+
+        self._compact()
+
+    def cancel(self, room_id):
+        return self.deadlines.pop(room_id, None) is not None
+
+    def _push(self, fire_at, token, room_id, event):
+        if not self._heap or fire_at < self._heap[0][0]:
+            self._wakeup.set()
+        heapq.heappush(self._heap, (fire_at, token, room_id, event))
+
+    # Перестройка кучи, когда устаревших записей стало больше, чем актуальных (до двух событий на комнату)
+    def _compact(self):
+        if len(self._heap) <= 4 * len(self.deadlines) + 64:
+            return
+
+        self._heap = [item for item in self._heap if self._is_actual(item[1], item[2])]
+        heapq.heapify(self._heap)
+
+    def _is_actual(self, token, room_id):
+        entry = self.deadlines.get(room_id)
+        return entry is not None and entry[0] == token
+
+    def _pop_due(self, now):
+        warnings, deletions = [], []
+
+        while self._heap and self._heap[0][0] <= now:
+            _, token, room_id, event = heapq.heappop(self._heap)
+            if not self._is_actual(token, room_id):
+                continue
+
+            if event == DELETE_EVENT:
+                self.deadlines.pop(room_id, None)
+                deletions.append(room_id)
+            else:
+                warnings.append(room_id)
+
+        return warnings, deletions
+
+    # Подгрузка из базы дедлайнов, попадающих в следующее окно горизонта
+    async def _load_window(self):
+        window_end = now_timestamp() + EXPIRY_HORIZON
+        rooms_cursor = self.rooms_collection.find(
+            {'expires_at': {'$gt': from_timestamp(self.loaded_until), '$lte': from_timestamp(window_end)}},
+            {'expires_at': 1}
+        )
+
+        loaded = 0
+        async for room in rooms_cursor:
+            if room['_id'] not in self.deadlines:
+                self.schedule(room['_id'], to_timestamp(room['expires_at']))
+                loaded += 1
+
+        self.loaded_until = window_end
+        logger.info(f"Загружено {loaded} дедлайнов комнат до {from_timestamp(window_end)}")
+
+    # Сверка сработавших событий с базой: комнаты могли удалить или продлить в другом процессе
+    async def _fire(self, warnings, deletions):
+        rooms = {
+            room_data['_id']: Room.from_dict(room_data)
+            async for room_data in self.rooms_collection.find({'_id': {'$in': warnings + deletions}})
+        }
+        now = now_timestamp() + CLOCK_SLACK
+
+        def due_room(room_id, fire_offset):
+            room = rooms.get(room_id)
+            if room is None:
+                return None
+
+            if room.expires_at is not None and to_timestamp(room.expires_at) - fire_offset > now:
+                self.schedule(room_id, to_timestamp(room.expires_at))
+                return None
+
+            return room
+
+        due_warnings = [room for room in (due_room(room_id, NOTIFY_TIME) for room_id in warnings) if room]
+        due_deletions = [room for room in (due_room(room_id, 0) for room_id in deletions) if room]
+
+        await self.warn(due_warnings)
+        await self.expire(due_deletions)
+
+    # Действия при срабатывании; симуляция переопределяет их, чтобы записывать каждое срабатывание
+    async def warn(self, rooms):
+        await send_warnings(self.bot, rooms)
+
+    async def expire(self, rooms):
+        await auto_delete_rooms(self.bot, rooms, self.rooms_collection)
+
+    async def _run(self):
+        while True:
+            if now_timestamp() >= self.loaded_until - EXPIRY_HORIZON / 2:
+                try:
+                    await self._load_window()
+                except Exception as e:
+                    logger.error(f"Ошибка при загрузке дедлайнов комнат: {e}")
+                    self.loaded_until = now_timestamp() + EXPIRY_HORIZON / 2
+
+            # Без действующей аренды ничего не удаляем, даже если задача еще не отменена
+            if self.lease is not None and not self.lease.is_valid():
+                await asyncio.sleep(LEASE_RENEW_INTERVAL)
+                continue
+
+            warnings, deletions = self._pop_due(now_timestamp())
+
+            if warnings or deletions:
+                try:
+                    await self._fire(warnings, deletions)
+                except Exception as e:
+                    logger.error(f"Ошибка при обработке пачки авто-удаления: {e}")
+                continue
+
+            timeout = self.loaded_until - EXPIRY_HORIZON / 2 - now_timestamp()
+            if self._heap:
+                timeout = min(timeout, self._heap[0][0] - now_timestamp())
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+expiry_scheduler = ExpiryScheduler()
+
+
+# Функция для отправки предупреждений об удалении пачкой
+async def send_warnings(bot: Bot, rooms):
+    for room in rooms:
+        await notification_dispatcher.enqueue(
             bot,
             room.chat.chat_id,
-            f"🔔 <b>Уведомление об удалении комнаты</b> 🔔\n\n"
-            f"Ваша комната с кодом <code>{room.code}</code> была автоматически удалена из-за истечения времени.\n\n"
-            f"Не поняли, как это произошло? Ознакомьтесь с разделами /help и /rules о команде <code>/update</code>."
+            f"⏳ <b>Предупреждение об удалении</b> ⏳\n\n"
+            f"Ваша комната с кодом <code>{room.code}</code> будет автоматически удалена через {NOTIFY_TIME / 60} минут.\n\n"
+            f"Если хотите продлить срок действия комнаты, используйте команду /update"
         )
 
 
-# Функция для отправки предупреждения и последующего удаления комнаты
-async def send_warning_and_delete(bot: Bot, room_id, delay, rooms_collection):
-    if delay > NOTIFY_TIME:
-        await asyncio.sleep(delay - NOTIFY_TIME)
-        room_data = await rooms_collection.find_one({'_id': room_id})
+# Удаление пачки комнат, чей дедлайн все еще истек; возвращает действительно удаленные комнаты
+async def delete_due_rooms(rooms, rooms_collection):
+    if not rooms:
+        return []
+
+    room_ids = [room.room_id for room in rooms]
+    # Повторная проверка дедлайна в самом запросе: комнату могли продлить после выборки
+    await rooms_collection.delete_many({
+        '_id': {'$in': room_ids},
+        'expires_at': {'$not': {'$gt': from_timestamp(now_timestamp() + CLOCK_SLACK)}}
+    })
+
+    # Оставшиеся комнаты продлили: возвращаем их новые дедлайны в планировщик
+    extended = {
+        room_data['_id']: room_data['expires_at']
+        async for room_data in rooms_collection.find({'_id': {'$in': room_ids}}, {'expires_at': 1})
+    }
+    for room_id, expires_at in extended.items():
+        expiry_scheduler.schedule(room_id, to_timestamp(expires_at))
+
+    deleted = [room for room in rooms if room.room_id not in extended]
+    for room in deleted:
+        for listener in deleted_room_listeners:
+            listener(room.room_id)
+
+    if deleted:
+        logger.info(f"Комнаты {[room.room_id for room in deleted]} были удалены автоматически")
 
-        if room_data:
-            room = Room.from_dict(room_data)
+    return deleted
 
-            await send_notification(
-                bot,
-                room.chat.chat_id,
-                f"⏳ <b>Предупреждение об удалении</b> ⏳\n\n"
-                f"Ваша комната с кодом <code>{room.code}</code> будет автоматически удалена через {NOTIFY_TIME / 60} минут.\n\n"
-                f"Если хотите продлить срок действия комнаты, используйте команду /update"
-            )
-        await asyncio.sleep(NOTIFY_TIME)
-    else:
-        await asyncio.sleep(delay)
 
-    await auto_delete_room(bot, room_id, rooms_collection)
+# Функция для автоматического удаления комнат пачкой
+async def auto_delete_rooms(bot: Bot, rooms, rooms_collection):
+    for room in await delete_due_rooms(rooms, rooms_collection):
+        await notification_dispatcher.enqueue(
+            bot,
+            room.chat.chat_id,
+            f"🔔 <b>Уведомление об удалении комнаты</b> 🔔\n\n"
+            f"Ваша комната с кодом <code>{room.code}</code> была автоматически удалена из-за истечения времени.\n\n"
+            f"Не поняли, как это произошло? Ознакомьтесь с разделами /help и /rules о команде <code>/update</code>."
+        )
 
 
 # Функция для планирования авто-удаления
 async def schedule_auto_delete(bot: Bot, room_id, delay, rooms_collection):
-    logger.info(f"Запланировано удаление комнаты {room_id} через {delay} секунд")
-    await send_warning_and_delete(bot, room_id, delay, rooms_collection)
+    expiry_scheduler.start(bot, rooms_collection)
+    expiry_scheduler.schedule(room_id, now_timestamp() + delay)
+    logger.info(f"Запланировано удаление комнаты {room_id} через {delay} секунд", extra={'room_id': room_id})
 
 
 #  Функция для отмены авто-удаления
 def cancel_auto_delete(room_id):
-    task = auto_delete_tasks.pop(room_id, None)
-    if task:
-        task.cancel()
-        logger.info(f"Авто-удаление комнаты {room_id} была отменена, т.к пользователь сам удалил")
+    if expiry_scheduler.cancel(room_id):
+        logger.info(f"Авто-удаление комнаты {room_id} была отменена, т.к пользователь сам удалил",
+                    extra={'room_id': room_id})
 
 
-# Функция для перепланирования авто-удаления
-async def reschedule_auto_delete(bot: Bot, room_id, rooms_collection):
-    cancel_auto_delete(room_id)
-    task = asyncio.create_task(schedule_auto_delete(bot, room_id, LIFE_TIME, rooms_collection))
-    auto_delete_tasks[room_id] = task
-    logger.info(f"Авто-удаление комнаты {room_id} была перепланирована, т.к пользователь обновил время жизни")
+# Функция для перепланирования авто-удаления: новый expires_at уже записан вместе с изменением комнаты
+async def reschedule_auto_delete(bot: Bot, room_id, expires_at, rooms_collection):
+    expiry_scheduler.start(bot, rooms_collection)
+    expiry_scheduler.schedule(room_id, to_timestamp(expires_at))
+    logger.info(f"Авто-удаление комнаты {room_id} перепланировано на {expires_at}", extra={'room_id': room_id})
 
 
 # Функция для восстановления задач авто-удаления
 async def restore_auto_deletion_tasks(bot: Bot, rooms_collection):
-    current_time = datetime.now()
     logger.info("Восстановление задач авто-удаления при запуске")
 
-    async for room in rooms_collection.find():
-        created_at = room['created_at']
-        elapsed_time = (current_time - created_at).total_seconds()
-        remaining_time = LIFE_TIME - elapsed_time
-
-        if remaining_time <= 0:
-            await rooms_collection.delete_one({'_id': room['_id']})
-            logger.info(f"Комната {room['_id']} была удалена из-за истечения времени, после перезапуска")
-        else:
-            task = asyncio.create_task(schedule_auto_delete(bot, room['_id'], remaining_time, rooms_collection))
-            auto_delete_tasks[room['_id']] = task
-            logger.info(f"Восстановлено удаление комнаты {room['_id']} через {remaining_time} секунд")
+    # Комнаты, истекшие пока бот был выключен, удалит с уведомлением владелец аренды:
+    # первое окно планировщика подгружает дедлайны с начала времени, в том числе прошедшие
+    expiry_scheduler.start(bot, rooms_collection)
@@ -0,0 +1,98 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, CallbackQuery
+
+from src.cache import TTLCache
+from src.ratelimit import KeyedTokenBuckets
+
+# Бюджеты сообщений: токенов в секунду и размер всплеска, на пользователя и на чат
+MESSAGE_USER_RATE, MESSAGE_USER_BURST = 1, 5
+MESSAGE_CHAT_RATE, MESSAGE_CHAT_BURST = 3, 15
+# Бюджеты нажатий на inline-кнопки
+CALLBACK_USER_RATE, CALLBACK_USER_BURST = 2, 8
+CALLBACK_CHAT_RATE, CALLBACK_CHAT_BURST = 5, 25
+
+# Не чаще одного предупреждения пользователю за это время, в секундах
+SLOW_DOWN_INTERVAL = 10
+SLOW_DOWN_TEXT = "Слишком много запросов, подождите немного ⏳"
+
+
+def event_chat_id(event: TelegramObject):
+    if isinstance(event, CallbackQuery):
+        return event.message.chat.id if event.message else None
+
+    return event.chat.id
+
+
+# Антифлуд на ведрах токенов: отдельные бюджеты на пользователя и на чат, лишние апдейты не доходят до обработчиков
+class ThrottlingMiddleware(BaseMiddleware):
+    def __init__(self, user_rate: float, user_burst: float, chat_rate: float, chat_burst: float):
+        self.users = KeyedTokenBuckets(user_rate, user_burst)
+        self.chats = KeyedTokenBuckets(chat_rate, chat_burst)
+        self.warned = TTLCache('slow_down', ttl=SLOW_DOWN_INTERVAL)
+        self.throttled = 0
+
+    def allow(self, event: TelegramObject) -> bool:
+        user = getattr(event, 'from_user', None)
+        if user is not None and not self.users.try_acquire(user.id):
+            return False
+
+        chat_id = event_chat_id(event)
+        return chat_id is None or self.chats.try_acquire(chat_id)
+
+    async def slow_down(self, event: TelegramObject):
+        if isinstance(event, CallbackQuery):
+            await event.answer(SLOW_DOWN_TEXT, cache_time=SLOW_DOWN_INTERVAL)
+            return
+
+        user_id = event.from_user.id if event.from_user else event.chat.id
+        if self.warned.peek(user_id) is None:
+            self.warned.set(user_id, True)
+            await event.answer(SLOW_DOWN_TEXT)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if self.allow(event):
+            return await handler(event, data)
+
+        self.throttled += 1
+        await self.slow_down(event)
+
+
+# Повторные нажатия той же кнопки, пока первое еще обрабатывается, только подтверждаются.
+# Оценки like и dislike одной комнаты - разные кнопки: update_user_rating атомарен, побеждает последняя
+class CallbackCollapseMiddleware(BaseMiddleware):
+    def __init__(self):
+        self._in_flight = set()
+        self.collapsed = 0
+
+    @staticmethod
+    def collapse_key(callback_query: CallbackQuery):
+        message_id = callback_query.message.message_id if callback_query.message else None
+        return callback_query.from_user.id, message_id, callback_query.data
+
+    async def __call__(
+        self,
+        handler: Callable[[CallbackQuery, Dict[str, Any]], Awaitable[Any]],
+        event: CallbackQuery,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not event.data:
+            return await handler(event, data)
+
+        key = self.collapse_key(event)
+        if key in self._in_flight:
+            self.collapsed += 1
+            await event.answer()
+            return None
+
+        self._in_flight.add(key)
+        try:
+            return await handler(event, data)
+        finally:
+            self._in_flight.discard(key)
@@ -1,5 +1,15 @@
-from src.config import users_collection, chats_collection, rooms_collection
-from src.models import User, Chat, Rating, Room
+from aiogram import types
+from aiogram.enums import ParseMode
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from src.config import users_collection, chats_collection, rooms_collection, ratings_collection, \
+    subscriptions_collection
+from src.models import User, Chat, Rating, Subscription
+from src.cache import users_cache, chats_cache
+from src.acl import admin_acl
+from src.content import content_store
+from src.room_index import room_index
 
 
 # Валидация кода комнаты
@@ -12,86 +22,139 @@ def validate_host(text):
     return 2 <= len(text) <= 15 and text.isprintable()
 
 
-async def get_content_file(name='', path_name='./info/', extension='.txt'):
-    path_file = path_name + name + extension
+# Отправка текста из папки info; длинные тексты уходят несколькими сообщениями
+async def answer_content(message: types.Message, name: str, reply_markup=None):
+    chunks = content_store.get(name)
+
+    for chunk in chunks[:-1]:
+        await message.answer(chunk, parse_mode=ParseMode.HTML)
+    await message.answer(chunks[-1], parse_mode=ParseMode.HTML, reply_markup=reply_markup)
+
+
+# Атомарный get-or-create одним запросом: документ создается из defaults, если его еще нет
+async def find_or_create(collection, query: dict, defaults: dict):
+    update = {'$setOnInsert': {key: value for key, value in defaults.items() if key not in query}}
+
     try:
-        with open(path_file, 'r') as f:
-            content = f.read()
-        return content
-    except FileNotFoundError:
-        return "Файл не найден"
+        return await collection.find_one_and_update(query, update, upsert=True, return_document=ReturnDocument.AFTER)
+    except DuplicateKeyError:
+        # Параллельный запрос уже создал документ
+        return await collection.find_one(query)
 
 
 async def get_user(user_id: int) -> User:
-    user = await users_collection.find_one({'user_id': user_id})
+    user = users_cache.get(user_id)
 
     if user is None:
-        user_data = User(user_id=user_id).to_dict()
-        await users_collection.insert_one(user_data)
-        user = await users_collection.find_one({'user_id': user_id})
+        user_data = await find_or_create(users_collection, {'user_id': user_id}, User(user_id=user_id).to_dict())
+        user = User.from_dict(user_data)
+        users_cache.set(user_id, user)
 
-    return User.from_dict(user)
+    return user
 
 
 async def get_chat(chat_id: int) -> Chat:
-    chat = await chats_collection.find_one({'chat_id': chat_id})
+    chat = chats_cache.get(chat_id)
 
     if chat is None:
-        chat_data = Chat(chat_id=chat_id).to_dict()
-        await chats_collection.insert_one(chat_data)
-        chat = await chats_collection.find_one({'chat_id': chat_id})
+        chat_data = await find_or_create(chats_collection, {'chat_id': chat_id}, Chat(chat_id=chat_id).to_dict())
+        chat = Chat.from_dict(chat_data)
+        chats_cache.set(chat_id, chat)
 
-    return Chat.from_dict(chat)
+    return chat
 
 
-async def update_user_subscriptions(user, chat: Chat, room_code, subscribe=True):
-    if subscribe:
-        # Проверяем, есть ли уже такой чат в подписках пользователя
-        if any(sub.chat_id == chat.chat_id for sub in user.subscribers):
-            return
+# Назначение или снятие прав администратора; возвращает False, если состояние не изменилось
+# или такого пользователя нет в базе
+async def set_user_admin(user_id: int, is_admin: bool) -> bool:
+    result = await users_collection.update_one({'user_id': user_id}, {'$set': {'is_admin': is_admin}})
 
-        user.subscribers.append(chat)
+    # Права в памяти повторяют базу: для неизвестного пользователя их не выдаем
+    if not result.matched_count:
+        return False
+
+    user = users_cache.peek(user_id)
+    if user is not None:
+        user.is_admin = is_admin
+
+    if is_admin:
+        admin_acl.grant(user_id)
     else:
-        # Удаляем чат из подписчиков пользователя
-        user.subscribers = [sub for sub in user.subscribers if sub.chat_id != chat.chat_id]
+        admin_acl.revoke(user_id)
+
+    return result.modified_count > 0
 
-    # Обновляем подписчиков пользователя в базе данных
-    await users_collection.update_one(
-        {'user_id': user.user_id},
-        {'$set': {'subscribers': [sub.to_dict() for sub in user.subscribers]}}
-    )
 
-    # Обновляем подписчиков владельца комнаты в базе данных
-    await rooms_collection.update_one(
-        {'code': room_code},
-        {'$set': {'owner.subscribers': [sub.to_dict() for sub in user.subscribers]}}
+# Денормализованные счетчики хранятся и у пользователя, и во вложенном владельце его комнат
+async def inc_owner_counters(owner_id: int, counters: dict):
+    await users_collection.update_one({'user_id': owner_id}, {'$inc': counters})
+    await rooms_collection.update_many(
+        {'owner_id': owner_id},
+        {'$inc': {'version': 1, **{f'owner.{name}': value for name, value in counters.items()}}}
     )
 
+    # Сквозная запись в кэш пользователей
+    owner = users_cache.peek(owner_id)
+    if owner is not None:
+        for name, value in counters.items():
+            setattr(owner, name, getattr(owner, name) + value)
 
-async def update_user_rating(user_id: int, room_code: str, is_like: bool):
-    room_data = await rooms_collection.find_one({'code': room_code})
-    if room_data is None:
-        return
+    room_index.update_owner(owner_id, counters)
 
-    room = Room.from_dict(room_data)
-    owner = await get_user(room.owner.user_id)
 
-    # Проверяем, существует ли уже реакция от этого пользователя
-    existing_rating = next((r for r in owner.rating if r.user_id == user_id), None)
+async def get_subscribers(owner_id: int):
+    async for subscription in subscriptions_collection.find({'owner_id': owner_id}, {'chat_id': 1}):
+        yield Chat.from_dict(subscription)
 
-    if existing_rating:
-        existing_rating.rating = is_like
+
+async def update_user_subscriptions(owner_id: int, chat_id: int, subscribe=True):
+    subscription = Subscription(owner_id, chat_id).to_dict()
+
+    if subscribe:
+        try:
+            result = await subscriptions_collection.update_one(
+                subscription, {'$setOnInsert': subscription}, upsert=True
+            )
+        except DuplicateKeyError:
+            # Параллельный клик уже создал подписку
+            return
+
+        delta = 1 if result.upserted_id is not None else 0
     else:
-        rating = Rating(is_like, user_id)
-        owner.rating.append(rating)
+        result = await subscriptions_collection.delete_one(subscription)
+        delta = -result.deleted_count
 
-    # Обновляем данные в базе данных
-    await users_collection.update_one(
-        {'user_id': owner.user_id},
-        {'$set': {'rating': [rating.to_dict() for rating in owner.rating]}}
-    )
+    if delta:
+        await inc_owner_counters(owner_id, {'subscriber_count': delta})
 
-    await rooms_collection.update_one(
-        {'code': room_code},
-        {'$set': {'owner.rating': [rating.to_dict() for rating in owner.rating]}}
-    )
+
+async def update_user_rating(user_id: int, room_code: str, is_like: bool):
+    room_data = await rooms_collection.find_one({'code': room_code}, {'owner_id': 1})
+    if room_data is None:
+        return
+
+    owner_id = room_data['owner_id']
+    rating = Rating(is_like, user_id, owner_id)
+
+    # Атомарно ставим реакцию и получаем предыдущую, чтобы поправить счетчики
+    try:
+        previous = await ratings_collection.find_one_and_update(
+            {'owner_id': owner_id, 'user_id': user_id},
+            {'$set': rating.to_dict()},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+    except DuplicateKeyError:
+        # Параллельный клик успел вставить реакцию, повторяем как обновление
+        previous = await ratings_collection.find_one_and_update(
+            {'owner_id': owner_id, 'user_id': user_id},
+            {'$set': rating.to_dict()},
+            return_document=ReturnDocument.BEFORE
+        )
+
+    counter, opposite = ('likes', 'dislikes') if is_like else ('dislikes', 'likes')
+
+    if previous is None:
+        await inc_owner_counters(owner_id, {counter: 1})
+    elif previous['rating'] != is_like:
+        await inc_owner_counters(owner_id, {counter: 1, opposite: -1})
@@ -0,0 +1,136 @@
+import asyncio
+import hmac
+import logging
+import signal
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiogram.types.update import UpdateTypeLookupError
+from aiohttp import web
+from pydantic import ValidationError
+
+from src.metrics import registry
+from src.config import WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, UPDATE_WORKERS, \
+    UPDATE_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Сколько секунд при остановке дообрабатываются принятые апдейты (docker stop ждет 10 с)
+DRAIN_TIMEOUT = 8
+
+
+# Ключ упорядочивания: апдейты одного чата (или пользователя) обрабатываются строго по очереди
+def update_order_key(update: Update) -> int:
+    # Неизвестный этой версии aiogram тип апдейта: dp пропустит его сам
+    try:
+        event = update.event
+    except UpdateTypeLookupError:
+        return update.update_id
+
+    chat = getattr(event, 'chat', None) or getattr(getattr(event, 'message', None), 'chat', None)
+    if chat is not None:
+        return chat.id
+
+    user = getattr(event, 'from_user', None)
+    return user.id if user is not None else update.update_id
+
+
+# Пул обработчиков апдейтов: очередь на воркер по ключу чата, чаты параллельно, один чат по порядку
+class UpdateWorkerPool:
+    def __init__(self, dp: Dispatcher, bot: Bot, workers: int = UPDATE_WORKERS, queue_size: int = UPDATE_QUEUE_SIZE):
+        self.dp = dp
+        self.bot = bot
+        self.queues = [asyncio.Queue(maxsize=max(1, queue_size // workers)) for _ in range(workers)]
+        self._workers = []
+
+    def start(self):
+        self._workers = [asyncio.create_task(self._worker(queue)) for queue in self.queues]
+
+    # Постановка апдейта в очередь; False, если очередь переполнена
+    def try_put(self, update: Update) -> bool:
+        queue = self.queues[update_order_key(update) % len(self.queues)]
+
+        try:
+            queue.put_nowait(update)
+        except asyncio.QueueFull:
+            return False
+
+        return True
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            update = await queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                logger.error(f"Ошибка при обработке апдейта {update.update_id}: {e}")
+            finally:
+                queue.task_done()
+
+    def pending(self) -> int:
+        return sum(queue.qsize() for queue in self.queues)
+
+    # Дообработка уже принятых апдейтов перед остановкой; не успевшие за timeout теряются
+    async def stop(self, timeout: float = DRAIN_TIMEOUT):
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self.queues)), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Не дообработано апдейтов при остановке: {self.pending()}")
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+
+def create_webhook_app(pool: UpdateWorkerPool, bot: Bot, secret: str = WEBHOOK_SECRET) -> web.Application:
+    async def handle_update(request: web.Request):
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), secret):
+            return web.Response(status=401)
+
+        try:
+            update = Update.model_validate(await request.json(), context={'bot': bot})
+        except (ValueError, ValidationError) as e:
+            logger.warning(f"Некорректный апдейт в вебхуке: {e}")
+            return web.Response(status=400)
+
+        # Ответ не 2xx заставит Telegram повторить доставку позже, апдейт не потеряется
+        if not pool.try_put(update):
+            logger.warning(f"Очередь апдейтов переполнена, апдейт {update.update_id} будет доставлен повторно")
+            return web.Response(status=503)
+
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle_update)
+    return app
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    pool = UpdateWorkerPool(dp, bot)
+    pool.start()
+    registry.gauge('bot_update_queue', 'Апдейты в очередях воркеров', pool.pending)
+
+    runner = web.AppRunner(create_webhook_app(pool, bot), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+
+    # Накопившиеся за время перезапуска апдейты не сбрасываем
+    await bot.set_webhook(
+        WEBHOOK_URL,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+        drop_pending_updates=False
+    )
+    logger.info(f"Вебхук слушает {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}, воркеров: {len(pool.queues)}")
+
+    # По SIGTERM (docker stop) перестаем принимать апдейты и дообрабатываем очереди.
+    # Апдейты, на которые уже ответили 200, хранятся только в памяти: при падении процесса они теряются
+    stopping = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stopping.set)
+
+    try:
+        await stopping.wait()
+    finally:
+        await runner.cleanup()
+        await pool.stop()
+        await dp.storage.close()